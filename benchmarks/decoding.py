@@ -0,0 +1,151 @@
+"""Compare the former and the current decoding of a poll on a synthetic housing.
+
+The former path decoded with json and kept a full copy of every zone, the
+current one decodes with orjson, when installed, and keeps the used zone
+fields only. The mixed rows split the difference between the two changes.
+
+Run from the repository root:  python benchmarks/decoding.py [zones] [polls]
+"""
+import importlib.util
+import json
+from pathlib import Path
+import sys
+import time
+import tracemalloc
+
+# Load the module alone, the integration package needs Home Assistant
+_PATH = Path(__file__).parents[1] / "custom_components/comapsmarthome/decoding.py"
+_SPEC = importlib.util.spec_from_file_location("decoding", _PATH)
+decoding = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(decoding)
+
+
+def thermal_details(zones, poll):
+    return {
+        "heating_system_state": "on",
+        "zones": [
+            {
+                "id": f"zone{index}",
+                "title": f"Zone {index}",
+                "temperature": 19 + (index + poll) % 3 * 0.5,
+                "humidity": 45,
+                "heating_status": "heating" if index % 2 else "cooling",
+                "set_point_type": "defined_temperature",
+                "set_point": {"instruction": "comfort", "origin": "schedule"},
+                "next_timeslot": {"begin_at": "18:00", "set_point": "comfort"},
+                "open_window": False,
+                "last_transmission": "2024-01-01T10:00:00+01:00",
+                "kids_lock": False,
+                "last_presence_detected": None,
+                "zone_type": "thermostat",
+                "devices": [
+                    {
+                        "serial_number": f"{index:08d}{device}",
+                        "model": "thermostat",
+                        "battery": {"level": 80, "status": "ok"},
+                        "firmware": {"version": "1.2.3", "date": "2023-06-01"},
+                        "radio": {"rssi": -60, "quality": "good", "channel": 11},
+                        "last_communication_date": "2024-01-01T10:00:00+01:00",
+                    }
+                    for device in range(3)
+                ],
+                "capabilities": ["temperature", "humidity", "presence", "window"],
+            }
+            for index in range(zones)
+        ],
+    }
+
+
+def programs(zones):
+    return {
+        "programs": [
+            {
+                "id": "program",
+                "is_activated": True,
+                "zones": [
+                    {"id": f"zone{index}", "schedule_id": "schedule", "title": "x"}
+                    for index in range(zones)
+                ],
+            }
+        ]
+    }
+
+
+TEMPERATURES = {
+    "connected": {"comfort": 20, "eco": 17, "night": 16},
+    "smart": {"comfort": 20.5, "eco": 17.5},
+}
+
+
+def _active(bodies, loads):
+    active = {}
+    for program in loads(bodies[1])["programs"]:
+        if program["is_activated"]:
+            active = {zone["id"]: zone for zone in program["zones"]}
+    return active
+
+
+def full(bodies, loads):
+    zones = loads(bodies[0])
+    zones_details = {zone["id"]: dict(zone) for zone in zones["zones"]}
+    for zone_id, zone in _active(bodies, loads).items():
+        zones_details[zone_id].update(zone)
+    return {**zones_details, "temperatures": loads(bodies[2])}
+
+
+def trimmed(bodies, loads):
+    zones = loads(bodies[0])
+    active = _active(bodies, loads)
+    zones_details = {
+        zone["id"]: decoding.trim_zone(zone, active.get(zone["id"]))
+        for zone in zones["zones"]
+    }
+    return {**zones_details, "temperatures": loads(bodies[2])}
+
+
+def run(decode, loads, polls_bodies, repeats=5):
+    elapsed = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for bodies in polls_bodies:
+            decode(bodies, loads)
+        elapsed = min(elapsed, time.perf_counter() - started)
+
+    tracemalloc.start()
+    kept = decode(polls_bodies[-1], loads)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = len(json.dumps(kept))
+    return elapsed / len(polls_bodies) * 1000, peak / 1024, size / 1024
+
+
+def main():
+    zones = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    polls = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    polls_bodies = [
+        (
+            json.dumps(thermal_details(zones, poll)).encode(),
+            json.dumps(programs(zones)).encode(),
+            json.dumps(TEMPERATURES).encode(),
+        )
+        for poll in range(polls)
+    ]
+    print(f"{zones} zones, {polls} polls, {len(polls_bodies[0][0]) // 1024} KiB payload")
+    variants = [
+        ("former: json, full copy", full, json.loads),
+        ("json, trimmed", trimmed, json.loads),
+    ]
+    if decoding.orjson is None:
+        print("orjson is not installed, the current path decodes with json")
+    else:
+        variants += [
+            ("orjson, full copy", full, decoding.orjson.loads),
+            ("current: orjson, trimmed", trimmed, decoding.orjson.loads),
+        ]
+    print(f"{'':28}{'ms/poll':>10}{'peak KiB':>10}{'kept KiB':>10}")
+    for name, decode, loads in variants:
+        ms, peak, kept = run(decode, loads, polls_bodies)
+        print(f"{name:28}{ms:10.3f}{peak:10.1f}{kept:10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,445 @@
 """ComapSmartHome custom component."""
 
-from asyncio import timeout
+from asyncio import gather, shield, timeout
 from datetime import timedelta
 import logging
+import random
+import threading
+
+import httpx
 
 from homeassistant import config_entries, core
-from homeassistant.exceptions import ConfigEntryAuthFailed
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.const import CONF_PASSWORD, CONF_SCAN_INTERVAL, CONF_USERNAME
+from homeassistant.exceptions import ConfigEntryAuthFailed, ConfigEntryNotReady
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util, slugify
 
-from .comap import ComapClientException, ComapClient
-from .const import DOMAIN
+from .comap import ComapClientAuthException, ComapClientException, ComapClient
+from .decoding import trim_zone
+from .heating import ComapHeatingStats
+from .journal import ComapCommandJournal, async_remove_journal
+from .profiling import ComapCallStats, instrument_client, instrument_coordinator
+from .schedule import ComapScheduleTimeline
+from .scheduler import ComapRequestScheduler
+from .services import async_register_services, async_unregister_services
+from .trend import ComapTemperatureHistory, resolve_set_point
+from .const import (
+    CONF_HEDGE_PERCENTILE,
+    CONF_POOL_SIZE,
+    CONF_PRESENCE_WINDOW,
+    CONF_REFRESH_TOKEN,
+    CONF_SCHEDULE_BASELINE_INTERVAL,
+    CONF_SENSOR_SCAN_INTERVAL,
+    CONF_TIMEOUT,
+    CONF_WRITE_CONCURRENCY,
+    DATA_SCHEDULER,
+    DATA_YAML_SESSIONS,
+    DEFAULT_HEDGE_PERCENTILE,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_PRESENCE_WINDOW,
+    DEFAULT_SCAN_INTERVAL,
+    DEFAULT_SCHEDULE_BASELINE_INTERVAL,
+    DEFAULT_SENSOR_SCAN_INTERVAL,
+    DEFAULT_TIMEOUT,
+    DEFAULT_WRITE_CONCURRENCY,
+    DOMAIN,
+    MAX_POLL_JITTER,
+    POLL_JITTER,
+    REQUEST_BURST,
+    REQUEST_RATE,
+    SERVICE_PROFILE,
+    SIGNAL_OPTIONS_UPDATED,
+    SIGNAL_ZONE_REMOVED,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+PLATFORMS = ["climate", "sensor", "binary_sensor", "switch"]
+
+DEFAULT_OPTIONS = {
+    CONF_SCAN_INTERVAL: DEFAULT_SCAN_INTERVAL,
+    CONF_TIMEOUT: DEFAULT_TIMEOUT,
+    CONF_PRESENCE_WINDOW: DEFAULT_PRESENCE_WINDOW,
+    CONF_SENSOR_SCAN_INTERVAL: DEFAULT_SENSOR_SCAN_INTERVAL,
+    CONF_POOL_SIZE: DEFAULT_POOL_SIZE,
+    CONF_WRITE_CONCURRENCY: DEFAULT_WRITE_CONCURRENCY,
+    CONF_SCHEDULE_BASELINE_INTERVAL: DEFAULT_SCHEDULE_BASELINE_INTERVAL,
+    CONF_HEDGE_PERCENTILE: DEFAULT_HEDGE_PERCENTILE,
+}
+
+# Delay after a schedule transition before refetching programs, so the cloud
+# reflects it
+SCHEDULE_REFRESH_DELAY = timedelta(seconds=10)
+# Schedules rarely change, refetch them at most this often
+SCHEDULES_MAX_AGE = timedelta(hours=1)
+# Consecutive refreshes a zone must be missing from before its device is removed
+ZONE_REMOVAL_REFRESHES = 3
+# Refresh intervals after which heating time is no longer booked to the last status
+MAX_STATISTICS_GAP_INTERVALS = 3
+
+
+def get_entry_options(entry: config_entries.ConfigEntry | None) -> dict:
+    """Return the entry options merged over the defaults."""
+    if entry is None:
+        return dict(DEFAULT_OPTIONS)
+    return {**DEFAULT_OPTIONS, **entry.options}
+
+
+def get_scheduler(hass: core.HomeAssistant) -> ComapRequestScheduler:
+    """Return the request scheduler shared by every client of this instance."""
+    if DATA_SCHEDULER not in hass.data:
+        hass.data[DATA_SCHEDULER] = ComapRequestScheduler(REQUEST_RATE, REQUEST_BURST)
+    return hass.data[DATA_SCHEDULER]
+
+
+async def async_get_yaml_session(
+    hass: core.HomeAssistant, username: str, password: str
+) -> tuple[ComapClient, ComapCommandJournal]:
+    """Return the client and command journal shared by the YAML platforms of an account.
+
+    The legacy platforms are set up concurrently, they wait on one connection
+    so a single journal replays the stored commands.
+    """
+    sessions = hass.data.setdefault(DATA_YAML_SESSIONS, {})
+    if username not in sessions:
+        sessions[username] = hass.async_create_task(
+            _async_yaml_session(hass, username, password)
+        )
+    try:
+        return await shield(sessions[username])
+    except Exception:
+        sessions.pop(username, None)
+        raise
+
+
+async def _async_yaml_session(hass, username, password):
+    client = ComapClient(
+        username=username, password=password, scheduler=get_scheduler(hass)
+    )
+    await client.async_connect()
+    journal = ComapCommandJournal(
+        hass, client, f"{DOMAIN}.{slugify(username)}.journal"
+    )
+    await journal.async_load()
+    return client, journal
+
 
 async def async_setup_entry(
     hass: core.HomeAssistant, entry: config_entries.ConfigEntry
 ) -> bool:
     """Set up platform from a ConfigEntry."""
+    options = get_entry_options(entry)
+    client = ComapClient(
+        username=entry.data[CONF_USERNAME],
+        password=entry.data[CONF_PASSWORD],
+        refresh_token=entry.data.get(CONF_REFRESH_TOKEN),
+        pool_size=options[CONF_POOL_SIZE],
+        write_concurrency=options[CONF_WRITE_CONCURRENCY],
+        hedge_percentile=options[CONF_HEDGE_PERCENTILE],
+        scheduler=get_scheduler(hass),
+    )
+    call_stats = None
+    if getattr(hass.config, "debug", False) or _LOGGER.isEnabledFor(logging.DEBUG):
+        call_stats = ComapCallStats(threading.get_ident())
+        instrument_client(client, call_stats)
+    try:
+        await client.async_connect()
+    except ComapClientAuthException as err:
+        await client.async_close()
+        raise ConfigEntryAuthFailed from err
+    except httpx.HTTPError as err:
+        await client.async_close()
+        raise ConfigEntryNotReady from err
+
+    # Keep the latest refresh token so the next start can skip the password login
+    if client.refresh_token != entry.data.get(CONF_REFRESH_TOKEN):
+        hass.config_entries.async_update_entry(
+            entry, data={**entry.data, CONF_REFRESH_TOKEN: client.refresh_token}
+        )
+
+    journal = ComapCommandJournal(hass, client, _journal_key(entry))
+    await journal.async_load()
+    entry.async_on_unload(journal.async_shutdown)
+
+    # Zone data read by every platform, fetched once before they are set up
+    coordinator = ComapCoordinator(hass, client, options)
+    coordinator.schedule_aware = True
+    if call_stats is not None:
+        instrument_coordinator(coordinator, call_stats)
+    try:
+        await coordinator.async_config_entry_first_refresh()
+    except Exception:
+        await client.async_close()
+        raise
+    entry.async_on_unload(
+        coordinator.async_add_listener(
+            async_track_removed_zones(hass, entry, coordinator)
+        )
+    )
+
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    hass.data[DOMAIN][entry.entry_id] = {
+        "client": client,
+        "coordinator": coordinator,
+        "call_stats": call_stats,
+        "journal": journal,
+    }
 
     # Forward the setup to the sensor platform.
-    await hass.config_entries.async_forward_entry_setups(
-        entry, ["climate", "sensor", "binary_sensor", "switch"]
-    )
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
+
+    if not hass.services.has_service(DOMAIN, SERVICE_PROFILE):
+        async_register_services(hass)
+
+    return True
+
+
+async def async_unload_entry(
+    hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> bool:
+    """Unload a config entry and release its pollers and connections."""
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if not unload_ok:
+        return False
+
+    data = hass.data[DOMAIN].pop(entry.entry_id)
+    await data["coordinator"].async_shutdown()
+    # A replay must not outlive the client it sends through
+    await data["journal"].async_shutdown()
+    await data["client"].async_close()
+
+    if not hass.data[DOMAIN]:
+        hass.data.pop(DOMAIN)
+        async_unregister_services(hass)
 
     return True
 
 
+async def async_remove_entry(
+    hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> None:
+    """Delete the command journal of a removed entry."""
+    await async_remove_journal(hass, _journal_key(entry))
+
+
+def _journal_key(entry: config_entries.ConfigEntry) -> str:
+    return f"{DOMAIN}.{entry.entry_id}.journal"
+
+
+def async_track_removed_zones(
+    hass: core.HomeAssistant,
+    entry: config_entries.ConfigEntry,
+    coordinator: "ComapCoordinator",
+):
+    """Return a coordinator listener removing the devices of zones gone from the housing.
+
+    A zone must be missing from several refreshes in a row, so a partial
+    answer from the API does not wipe entities. The zone statistics and
+    temperature history are dropped along with the device.
+    """
+    missing: dict[str, int] = {}
+    known = set(coordinator.zones())
+
+    @core.callback
+    def _async_check_zones() -> None:
+        if not coordinator.last_update_success:
+            return
+        current = set(coordinator.zones())
+        known.update(current)
+        for zone_id in list(known - current):
+            missing[zone_id] = missing.get(zone_id, 0) + 1
+            if missing[zone_id] < ZONE_REMOVAL_REFRESHES:
+                continue
+            _LOGGER.info("Zone %s was removed from the housing", zone_id)
+            known.discard(zone_id)
+            del missing[zone_id]
+            coordinator.heating_stats.pop(zone_id, None)
+            coordinator.temperature_history.remove(zone_id)
+            coordinator.trends.pop(zone_id, None)
+            device_registry = dr.async_get(hass)
+            device = device_registry.async_get_device(identifiers={(DOMAIN, zone_id)})
+            if device is not None:
+                device_registry.async_update_device(
+                    device.id, remove_config_entry_id=entry.entry_id
+                )
+            # Lets the platforms add the zone again should it come back
+            async_dispatcher_send(
+                hass, SIGNAL_ZONE_REMOVED.format(entry.entry_id), zone_id
+            )
+        for zone_id in current:
+            missing.pop(zone_id, None)
+
+    return _async_check_zones
+
+
+async def async_update_options(
+    hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> None:
+    """Apply changed options to the running client, coordinators and entities."""
+    options = get_entry_options(entry)
+    data = hass.data[DOMAIN][entry.entry_id]
+    data["client"].configure(
+        pool_size=options[CONF_POOL_SIZE],
+        write_concurrency=options[CONF_WRITE_CONCURRENCY],
+        hedge_percentile=options[CONF_HEDGE_PERCENTILE],
+    )
+    data["coordinator"].apply_options(options)
+    async_dispatcher_send(hass, SIGNAL_OPTIONS_UPDATED.format(entry.entry_id), options)
+
+
 class ComapCoordinator(DataUpdateCoordinator):
     """My custom coordinator."""
 
-    def __init__(self, hass, comap_client):
+    def __init__(self, hass, comap_client, options=None):
+        options = {**DEFAULT_OPTIONS, **(options or {})}
         super().__init__(
             hass,
             _LOGGER,
             # Name of the data. For logging purposes.
             name="ComapSmartHome",
             # Polling interval. Will only be polled if there are subscribers.
-            update_interval=timedelta(seconds=30),
+            update_interval=timedelta(seconds=options[CONF_SCAN_INTERVAL]),
         )
         self.client = comap_client
+        self.request_timeout = options[CONF_TIMEOUT]
+        self.scan_interval = timedelta(seconds=options[CONF_SCAN_INTERVAL])
+        self.baseline_interval = timedelta(
+            seconds=options[CONF_SCHEDULE_BASELINE_INTERVAL]
+        )
+        # When set, programs and custom temperatures are refetched right after
+        # schedule transitions and at the baseline interval in between, instead
+        # of along with the zones on every refresh
+        self.schedule_aware = False
+        self.timeline = ComapScheduleTimeline()
+        self.schedules = None
+        self._schedules_fetched = None
+        self.zone_schedules = None
+        self.temperatures = None
+        self._programs_due = None
+        # Schedule ids of zones absent from the last schedules fetched, not
+        # refetched for until the schedules expire
+        self._missing_schedule_ids = set()
+        self.heating_stats: dict[str, ComapHeatingStats] = {}
+        self.temperature_history = ComapTemperatureHistory()
+        self.trends: dict[str, dict] = {}
+        # Housing level fields of the thermal details, such as the heating system state
+        self.housing_state: dict = {}
+        self.last_refreshed = None
+        # Offset of the second poll, spreading coordinators sharing a scheduler
+        # over the interval instead of polling in step
+        self._phase = None
+        if comap_client.scheduler is not None:
+            self._phase = comap_client.scheduler.next_phase()
+
+    def apply_options(self, options):
+        """Update polling interval and timeout, effective from the next refresh."""
+        self.scan_interval = timedelta(seconds=options[CONF_SCAN_INTERVAL])
+        self.baseline_interval = timedelta(
+            seconds=options[CONF_SCHEDULE_BASELINE_INTERVAL]
+        )
+        self.update_interval = self.scan_interval
+        self.request_timeout = options[CONF_TIMEOUT]
+        self._programs_due = None
+
+    def detached_copy(self) -> "ComapCoordinator":
+        """Return a coordinator polling the same client, with statistics of its own.
+
+        Nothing listens to the copy, refreshing it leaves the entities and
+        the statistics of this coordinator untouched.
+        """
+        copy = ComapCoordinator(self.hass, self.client)
+        copy.schedule_aware = self.schedule_aware
+        copy.request_timeout = self.request_timeout
+        copy.scan_interval = self.scan_interval
+        copy.baseline_interval = self.baseline_interval
+        return copy
+
+    def expire_programs(self) -> None:
+        """Refetch programs and custom temperatures on the next refresh."""
+        self._programs_due = None
+
+    def _programs_expired(self, now) -> bool:
+        return (
+            not self.schedule_aware
+            or self._programs_due is None
+            or now >= self._programs_due
+        )
+
+    def _staggered(self, interval: timedelta) -> timedelta:
+        """Return the interval shifted by the poll phase, once, and some jitter."""
+        seconds = interval.total_seconds()
+        if self._phase is not None:
+            seconds += self._phase * self.scan_interval.total_seconds()
+            self._phase = None
+        seconds += random.uniform(0, min(seconds * POLL_JITTER, MAX_POLL_JITTER))
+        return timedelta(seconds=seconds)
+
+    def _schedules_expired(self, now) -> bool:
+        return (
+            self.schedules is None or now - self._schedules_fetched > SCHEDULES_MAX_AGE
+        )
+
+    async def _async_update_timeline(self, zones_details) -> None:
+        """Refresh the schedule timeline and time the next program fetch on it."""
+        now = dt_util.now()
+        known = {schedule.get("id") for schedule in self.schedules or []}
+        unknown = {
+            zone.get("schedule_id")
+            for zone in zones_details.values()
+            if zone.get("schedule_id") is not None
+        } - known
+        # Expired schedules are fetched along with the zones, refetch them
+        # here only if a zone moved to a schedule created since
+        if unknown - self._missing_schedule_ids:
+            self.schedules = await self.client.get_schedules()
+            self._schedules_fetched = now
+            known = {schedule.get("id") for schedule in self.schedules or []}
+            self._missing_schedule_ids = unknown - known
+        self.timeline.update(zones_details, self.schedules, now)
+
+        due = now + self.baseline_interval
+        transition = self.timeline.next_transition(now)
+        if transition is not None:
+            due = min(due, transition + SCHEDULE_REFRESH_DELAY)
+        self._programs_due = due
+
+    def zones(self) -> dict:
+        """Return the data of the zones seen by the last refresh, by zone id."""
+        return {
+            zone_id: zone
+            for zone_id, zone in (self.data or {}).items()
+            if zone_id != "temperatures"
+        }
+
+    def _update_heating_stats(self, zones_details) -> None:
+        now = dt_util.utcnow().timestamp()
+        # Longer gaps come from failed refreshes and are left unobserved
+        max_gap = MAX_STATISTICS_GAP_INTERVALS * self.update_interval.total_seconds()
+        for zone_id, zone in zones_details.items():
+            stats = self.heating_stats.setdefault(zone_id, ComapHeatingStats())
+            stats.update(zone.get("heating_status") == "heating", now, max_gap)
+
+    def _update_trends(self, zones_details, temperatures) -> None:
+        now = dt_util.utcnow().timestamp()
+        self.temperature_history.add(
+            now,
+            {
+                zone_id: (
+                    zone.get("temperature"),
+                    resolve_set_point(zone, temperatures),
+                    zone.get("heating_status") == "heating",
+                )
+                for zone_id, zone in zones_details.items()
+                if zone.get("temperature") is not None
+            },
+        )
+        self.trends = self.temperature_history.estimate(
+            now, MAX_STATISTICS_GAP_INTERVALS * self.update_interval.total_seconds()
+        )
 
     async def _async_update_data(self) -> dict:
         """Fetch data from API endpoint.
@@ -52,22 +450,49 @@ class ComapCoordinator(DataUpdateCoordinator):
         try:
             # Note: asyncio.TimeoutError and aiohttp.ClientError are already
             # handled by the data update coordinator.
-            async with timeout(10):
-                zones = await self.client.get_zones()
-                zones_details = dict()
-                for zone in zones["zones"]:
-                    zone_detail = dict()
-                    zone_detail.update(zone)
-                    zones_details[zone["id"]] = zone_detail
-                zone_schedules = await self.client.get_active_schedules()
-                for zone in zone_schedules:
-                    zones_details[zone["id"]].update(zone)
-                temperatures = await self.client.get_custom_temperatures()
+            async with timeout(self.request_timeout):
+                # One concurrent round trip, which also serves as the shared
+                # initial fetch every platform builds its entities from. The
+                # zones change all the time, programs and custom temperatures
+                # only around schedule transitions or when edited
+                now = dt_util.now()
+                requests = [self.client.get_zones()]
+                fetch_programs = self._programs_expired(now)
+                if fetch_programs:
+                    requests.append(self.client.get_active_schedules())
+                    requests.append(self.client.get_custom_temperatures())
+                    if self.schedule_aware and self._schedules_expired(now):
+                        requests.append(self.client.get_schedules())
+                zones, *results = await gather(*requests)
+                if fetch_programs:
+                    self.zone_schedules, self.temperatures, *schedules = results
+                    if schedules:
+                        self.schedules = schedules[0]
+                        self._schedules_fetched = now
+                        self._missing_schedule_ids = set()
+                temperatures = self.temperatures
+                # Keep only the used fields
+                active = {zone["id"]: zone for zone in self.zone_schedules}
+                zones_details = {
+                    zone["id"]: trim_zone(zone, active.get(zone["id"]))
+                    for zone in zones["zones"]
+                }
+                if self.schedule_aware and fetch_programs:
+                    await self._async_update_timeline(zones_details)
+                self.update_interval = self._staggered(self.scan_interval)
+                self._update_heating_stats(zones_details)
+                self._update_trends(zones_details, temperatures)
+                self.housing_state = {
+                    key: value for key, value in zones.items() if key != "zones"
+                }
+                self.last_refreshed = dt_util.utcnow()
                 return {
                     # **{zone["id"]: zone for zone in zone_schedules},
                     **zones_details,
                     "temperatures": temperatures,
                 }
+        except httpx.HTTPError as err:
+            raise UpdateFailed(f"Error communicating with Comap API: {err}") from err
         except ComapClientException as err:
             # Raising ConfigEntryAuthFailed will cancel future updates
             # and start a config flow with SOURCE_REAUTH (async_step_reauth)
@@ -6,13 +6,18 @@ from homeassistant.components.binary_sensor import (
     BinarySensorEntity,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from . import ComapClient, ComapCoordinator
-from .const import DOMAIN
+from . import ComapCoordinator, get_entry_options
+from .const import (
+    CONF_PRESENCE_WINDOW,
+    DOMAIN,
+    SIGNAL_OPTIONS_UPDATED,
+    SIGNAL_ZONE_REMOVED,
+)
 
 
 async def async_setup_entry(
@@ -20,33 +25,62 @@ async def async_setup_entry(
     config_entry: ConfigEntry,
     async_add_entities,
 ) -> None:
-    config = hass.data[DOMAIN][config_entry.entry_id]
-    client = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
-    coordinator = ComapCoordinator(hass, client)
-    await coordinator.async_config_entry_first_refresh()
-    entities = list()
-    for zone_id, zone in coordinator.data.items():
-        if (
-            "last_presence_detected" in zone.keys()
-            and zone["last_presence_detected"] != None
-        ):
+    data = hass.data[DOMAIN][config_entry.entry_id]
+    client = data["client"]
+    coordinator = data["coordinator"]
+
+    known = set()
+
+    @callback
+    def _async_add_new_sensors() -> None:
+        """Add presence sensors for zones that started reporting presence."""
+        zones = coordinator.zones()
+        entities = list()
+        for zone_id, zone in zones.items():
+            if zone_id in known or zone.get("last_presence_detected") is None:
+                continue
+            known.add(zone_id)
             entities.append(
                 ComapPresenceSensor(
-                    coordinator=coordinator, zone_id=zone_id, client=client
+                    coordinator=coordinator,
+                    zone_id=zone_id,
+                    client=client,
+                    presence_window=get_entry_options(config_entry)[
+                        CONF_PRESENCE_WINDOW
+                    ],
                 )
             )
-    # entities: entities
-    async_add_entities(entities)
+        if entities:
+            async_add_entities(entities)
+
+    @callback
+    def _async_zone_removed(zone_id) -> None:
+        """Forget a zone whose device was removed, so it is added again if it returns."""
+        known.discard(zone_id)
+
+    _async_add_new_sensors()
+    config_entry.async_on_unload(coordinator.async_add_listener(_async_add_new_sensors))
+    config_entry.async_on_unload(
+        async_dispatcher_connect(
+            hass,
+            SIGNAL_ZONE_REMOVED.format(config_entry.entry_id),
+            _async_zone_removed,
+        )
+    )
 
 
 class ComapPresenceSensor(CoordinatorEntity[ComapCoordinator], BinarySensorEntity):
-    def __init__(self, coordinator: ComapCoordinator, zone_id, client):
+    def __init__(
+        self, coordinator: ComapCoordinator, zone_id, client, presence_window=120
+    ):
         super().__init__(coordinator)
         self.client = client
+        self.presence_window = timedelta(seconds=presence_window)
         self.coordinator = coordinator
         self.zone_id = zone_id
         self._attr_device_class = BinarySensorDeviceClass.OCCUPANCY
-        self._name = self.coordinator.data[self.zone_id]["title"] + " presence"
+        self._zone_name = self.coordinator.data[self.zone_id]["title"]
+        self._name = self._zone_name + " presence"
         self._id = zone_id + "_presence"
         self._is_on = None
         self.attrs = dict()
@@ -59,7 +93,7 @@ class ComapPresenceSensor(CoordinatorEntity[ComapCoordinator], BinarySensorEntit
                 # Serial numbers are unique identifiers within a specific domain
                 (DOMAIN, self.zone_id)
             },
-            name=self.coordinator.data[self.zone_id]["title"],
+            name=self._zone_name,
             manufacturer="comap",
         )
 
@@ -85,24 +119,44 @@ class ComapPresenceSensor(CoordinatorEntity[ComapCoordinator], BinarySensorEntit
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
-        self._is_on = self.is_occupied(
-            self.coordinator.data[self.zone_id]["last_presence_detected"]
-        )
-        self.attrs.update(
-            {
-                "last_presence_detected": self.coordinator.data[self.zone_id][
-                    "last_presence_detected"
-                ],
-            }
+        zone_data = self.coordinator.data.get(self.zone_id)
+        if zone_data is None:
+            # Zone missing from the housing, removed once it stays gone
+            self._attr_available = False
+            self.async_write_ha_state()
+            return
+        self._attr_available = True
+        last_presence = zone_data.get("last_presence_detected")
+        self._is_on = (
+            None
+            if last_presence is None
+            else self.is_occupied(last_presence, self.presence_window)
         )
+        self.attrs.update({"last_presence_detected": last_presence})
         self.async_write_ha_state()
 
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        if self.coordinator.config_entry is None:
+            return
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass,
+                SIGNAL_OPTIONS_UPDATED.format(self.coordinator.config_entry.entry_id),
+                self._async_options_updated,
+            )
+        )
+
+    @callback
+    def _async_options_updated(self, options) -> None:
+        self.presence_window = timedelta(seconds=options[CONF_PRESENCE_WINDOW])
+        self._handle_coordinator_update()
+
     @staticmethod
-    def is_occupied(timestamp):
+    def is_occupied(timestamp, window=timedelta(minutes=2)):
         now = datetime.now(timezone.utc)
         presence = datetime.fromisoformat(timestamp)
-        two_minutes = timedelta(minutes=2)
-        if now - presence < two_minutes:
+        if now - presence < window:
             return True
         else:
             return False
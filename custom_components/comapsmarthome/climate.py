@@ -23,15 +23,23 @@ from homeassistant.const import (
     UnitOfTemperature,
 )
 from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import config_validation as cv, entity_platform
 from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from . import ComapCoordinator
-from .comap import ComapClient
-from .const import ATTR_SCHEDULE_NAME, DOMAIN, SERVICE_SET_SCHEDULE
+from . import ComapCoordinator, async_get_yaml_session, get_entry_options
+from .comap import ComapClientConflictException
+from .const import (
+    ATTR_SCHEDULE_NAME,
+    DOMAIN,
+    SERVICE_SET_SCHEDULE,
+    SIGNAL_ZONE_REMOVED,
+)
+from .journal import ComapCommandJournal
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -60,30 +68,80 @@ async def async_setup_entry(
     config_entry: ConfigEntry,
     async_add_entities,
 ):
-    config = hass.data[DOMAIN][config_entry.entry_id]
-    await async_setup_platform(hass, config, async_add_entities)
+    data = hass.data[DOMAIN][config_entry.entry_id]
+    await async_setup_client(
+        hass,
+        data["coordinator"],
+        data["journal"],
+        async_add_entities,
+    )
 
 
 async def async_setup_platform(
     hass: HomeAssistant,
     config: ConfigType,
     async_add_entities: AddEntitiesCallback,
+    discovery_info=None,
 ) -> None:
     """Set up the comapsmarthome platform."""
 
-    client = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
-    coordinator = ComapCoordinator(hass, client)
+    client, journal = await async_get_yaml_session(
+        hass, config[CONF_USERNAME], config[CONF_PASSWORD]
+    )
+    options = get_entry_options(None)
+    if CONF_SCAN_INTERVAL in config:
+        options[CONF_SCAN_INTERVAL] = cv.time_period(
+            config[CONF_SCAN_INTERVAL]
+        ).total_seconds()
+    coordinator = ComapCoordinator(hass, client, options)
+    coordinator.schedule_aware = True
+    await coordinator.async_refresh()
+    await async_setup_client(hass, coordinator, journal, async_add_entities)
+
+
+async def async_setup_client(
+    hass: HomeAssistant,
+    coordinator: ComapCoordinator,
+    journal: ComapCommandJournal,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up zone thermostats from the data of a refreshed coordinator."""
+    client = coordinator.client
 
-    housing_details = await client.get_zones()
-    zones = [
-        ComapZoneThermostat(coordinator, client, zone)
-        for zone in housing_details.get("zones")
-    ]
+    known = set()
 
-    await coordinator.async_config_entry_first_refresh()
-    async_add_entities(zones, update_before_add=True)
+    @callback
+    def _async_add_new_zones() -> None:
+        """Add thermostats for zones that appeared since the last refresh."""
+        zones = coordinator.zones()
+        new = [zone_id for zone_id in zones if zone_id not in known]
+        known.update(new)
+        if new:
+            async_add_entities(
+                [
+                    ComapZoneThermostat(coordinator, client, zones[zone_id], journal)
+                    for zone_id in new
+                ]
+            )
 
-    schedules = await client.get_schedules()
+    @callback
+    def _async_zone_removed(zone_id) -> None:
+        """Forget a zone whose device was removed, so it is added again if it returns."""
+        known.discard(zone_id)
+
+    _async_add_new_zones()
+    unsub = coordinator.async_add_listener(_async_add_new_zones)
+    entry = coordinator.config_entry
+    if entry is not None:
+        entry.async_on_unload(unsub)
+        entry.async_on_unload(
+            async_dispatcher_connect(
+                hass, SIGNAL_ZONE_REMOVED.format(entry.entry_id), _async_zone_removed
+            )
+        )
+
+    # Fetched with the first refresh to build the schedule timeline
+    schedules = coordinator.schedules or []
 
     platform = entity_platform.async_get_current_platform()
     platform.async_register_entity_service(
@@ -113,9 +171,10 @@ class ComapZoneThermostat(CoordinatorEntity[ComapCoordinator], ClimateEntity):
     ]
     _attr_hvac_mode: HVACMode | None
 
-    def __init__(self, coordinator: ComapCoordinator, client, zone):
+    def __init__(self, coordinator: ComapCoordinator, client, zone, journal):
         super().__init__(coordinator)
         self.client = client
+        self.journal = journal
         self.zone_id = zone.get("id")
         self._name = zone.get("title")
         self._available = True
@@ -139,7 +198,11 @@ class ComapZoneThermostat(CoordinatorEntity[ComapCoordinator], ClimateEntity):
             )
             self._attr_supported_features = ClimateEntityFeature.PRESET_MODE
         self._hvac_mode: HVACMode = self.map_hvac_mode(zone.get("heating_status"))
-        self.attrs: dict[str, Any] = {}
+        # Whether a temporary instruction runs on the zone, None when unknown
+        self._temporary_instruction_active = None
+        if "temporary_instruction" in zone:
+            self._temporary_instruction_active = bool(zone["temporary_instruction"])
+        self.attrs: dict[str, Any] = dict(zone)
         self.added = False
 
     @property
@@ -195,7 +258,10 @@ class ComapZoneThermostat(CoordinatorEntity[ComapCoordinator], ClimateEntity):
             "kids_lock",
         ]
         try:
-            return {key: self.attrs[key] for key in keys}
+            return {
+                **{key: self.attrs[key] for key in keys},
+                **self.coordinator.trends.get(self.zone_id, {}),
+            }
         except:
             _LOGGER.warning("Failed to update extra attributes for zone " + self.name)
             return None
@@ -203,19 +269,23 @@ class ComapZoneThermostat(CoordinatorEntity[ComapCoordinator], ClimateEntity):
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
-        self.attrs.update(self.coordinator.data[self.zone_id])
-        self.attributes_update(self.coordinator.data[self.zone_id])
-        self.async_schedule_update_ha_state(force_refresh=True)
+        zone_data = self.coordinator.data.get(self.zone_id)
+        if zone_data is None:
+            # Zone missing from the housing, removed once it stays gone
+            self._available = False
+            self.async_write_ha_state()
+            return
+        self._available = True
+        self.attrs.update(zone_data)
+        self.attributes_update(zone_data)
+        self.async_write_ha_state()
 
     async def async_added_to_hass(self) -> None:
         self.added = True
         return await super().async_added_to_hass()
 
     async def async_set_preset_mode(self, preset_mode: str) -> None:
-        await self.client.set_temporary_instruction(
-            self.zone_id, self.map_comap_mode(preset_mode)
-        )
-        await self.async_update()
+        await self.set_temporary_instruction(self.map_comap_mode(preset_mode))
 
     async def async_set_hvac_mode(self, hvac_mode: str) -> bool:
         """Set new hvac mode."""
@@ -224,25 +294,43 @@ class ComapZoneThermostat(CoordinatorEntity[ComapCoordinator], ClimateEntity):
         elif (hvac_mode == HVACMode.HEAT) & (self.zone_type == "pilot_wire"):
             await self.async_set_preset_mode(PRESET_COMFORT)
         elif (hvac_mode == HVACMode.OFF) & (self.zone_type == "thermostat"):
-            await self.client.set_temporary_instruction(self.zone_id, 8)
-            await self.async_update()
+            await self.set_temporary_instruction(8)
         elif (hvac_mode == HVACMode.HEAT) & (self.zone_type == "thermostat"):
-            await self.client.set_temporary_instruction(self.zone_id, 20)
-            await self.async_update()
+            await self.set_temporary_instruction(20)
 
     async def async_set_temperature(self, **kwargs) -> None:
-        await self.client.set_temporary_instruction(self.zone_id, kwargs["temperature"])
-        await self.async_update()
+        await self.set_temporary_instruction(kwargs["temperature"])
+
+    async def set_temporary_instruction(self, instruction) -> None:
+        """Send an instruction through the journal, refreshing the zone once it is applied."""
+        try:
+            sent = await self.journal.async_submit(
+                "set_temporary_instruction",
+                zone=self.zone_id,
+                instruction=instruction,
+                active=self._temporary_instruction_active,
+            )
+        except ComapClientConflictException as err:
+            raise HomeAssistantError(
+                f"Comap refused the instruction for {self.name}: {err}"
+            ) from err
+        if sent:
+            await self.async_update()
+        else:
+            # Journaled, the zone state is unknown until the command is replayed
+            self._temporary_instruction_active = None
 
     async def async_update(self):
-        zone_data = await self.hass.async_add_executor_job(
-            self.client.get_zone, self.zone_id
-        )
+        zone_data = await self.client.async_get_zone(self.zone_id)
         self.attributes_update(zone_data)
         if self.added == True:
             self.async_write_ha_state()
 
     def attributes_update(self, zone_data):
+        if "temporary_instruction" in zone_data:
+            self._temporary_instruction_active = bool(
+                zone_data["temporary_instruction"]
+            )
         self._current_temperature = zone_data.get("temperature")
         self._current_humidity = zone_data.get("humidity")
         self._hvac_mode = self.map_hvac_mode(zone_data.get("heating_status"))
@@ -290,9 +378,13 @@ class ComapZoneThermostat(CoordinatorEntity[ComapCoordinator], ClimateEntity):
 
     async def service_set_schedule(self, **kwargs: Any):
         """Set schedule by id for the zone"""
-        r = await self.client.set_schedule(self.zone_id, kwargs.get(ATTR_SCHEDULE_NAME))
-
-        # Update the data
-        await self.coordinator.async_request_refresh()
+        sent = await self.journal.async_submit(
+            "set_schedule",
+            zone=self.zone_id,
+            schedule_id=kwargs.get(ATTR_SCHEDULE_NAME),
+        )
 
-        return r
+        # Update the data, with the programs now holding the new schedule
+        if sent:
+            self.coordinator.expire_programs()
+            await self.coordinator.async_request_refresh()
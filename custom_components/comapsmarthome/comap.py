@@ -1,23 +1,86 @@
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
 import httpx
 from datetime import datetime
 import logging
-from threading import Lock
+import time
+
+from .decoding import loads
+from .latency import ComapLatencyTracker
+from .scheduler import PRIORITY_POLL, PRIORITY_WRITE
+from .tracing import ComapRecordingTransport, ComapTraceRecorder
 
 _LOGGER = logging.getLogger(__name__)
-_TOKEN_LOCK = Lock()
+
+# Per request timeouts in seconds, by endpoint
+ENDPOINT_TIMEOUTS = {
+    "thermal-details": 6,
+    "programs": 4,
+    "schedules": 4,
+    "custom-temperatures": 4,
+    "housings": 4,
+}
+DEFAULT_TIMEOUT = 10
+
+# Cognito error types meaning the credentials or refresh token were rejected
+AUTH_REJECTED_ERRORS = (
+    "NotAuthorizedException",
+    "UserNotFoundException",
+    "PasswordResetRequiredException",
+)
+
+
+def endpoint_name(url):
+    """Return the endpoint a URL belongs to, as used for timeouts and latency."""
+    segments = httpx.URL(url).path.strip("/").split("/")
+    for segment in reversed(segments):
+        if segment in ENDPOINT_TIMEOUTS:
+            return segment
+    return segments[-1]
 
 
 class ComapClient(object):
     _BASEURL = "https://api.comapsmarthome.com/"
+    _AUTHURL = "https://cognito-idp.eu-west-3.amazonaws.com"
     login_headers = {}
     login_payload = {}
     token = ""
     last_request = ""
     token_expires = ""
     clientid = ""
-
-    def __init__(self, username, password, clientid="56jcvrtejpracljtirq7qnob44"):
+    refresh_token = None
+
+    def __init__(
+        self,
+        username,
+        password,
+        refresh_token=None,
+        clientid="56jcvrtejpracljtirq7qnob44",
+        pool_size=10,
+        write_concurrency=4,
+        transport=None,
+        hedge_percentile=95,
+        scheduler=None,
+    ):
         self.clientid = clientid
+        self.refresh_token = refresh_token
+        self.housing = None
+        # Details of the housing, as listed by park/housings
+        self.housing_info = None
+        self._http = None
+        self._retired_http = []
+        self._in_flight = {}
+        self._closing = set()
+        self._pool_size = pool_size
+        self._write_semaphore = asyncio.Semaphore(write_concurrency)
+        self._token_lock = asyncio.Lock()
+        self._transport = transport
+        self.recorder = None
+        self.latency = ComapLatencyTracker()
+        # Duplicate a slow GET once it outlasts this latency percentile, 0 disables
+        self.hedge_percentile = hedge_percentile
+        # Shared ComapRequestScheduler rationing requests across clients, if any
+        self.scheduler = scheduler
         self.login_headers = {
             "Content-Type": "application/x-amz-json-1.1",
             "x-amz-target": "AWSCognitoIdentityProviderService.InitiateAuth",
@@ -32,73 +95,258 @@ class ComapClient(object):
             },
             "ClientId": clientid,
         }
-        try:
-            self.login()
-            housings = self.get_housings()
-            self.housing = housings[0].get("id")
-        except AttributeError as err:
-            raise ComapClientAuthException from err
 
-    def login(self):
+    def configure(self, pool_size=None, write_concurrency=None, hedge_percentile=None):
+        """Change connection pool size, write concurrency and hedging on a live client."""
+        if pool_size is not None and pool_size != self._pool_size:
+            self._pool_size = pool_size
+            self._retire_http()
+        if write_concurrency is not None:
+            self._write_semaphore = asyncio.Semaphore(write_concurrency)
+        if hedge_percentile is not None:
+            self.hedge_percentile = hedge_percentile
+
+    def start_recording(self):
+        """Record every following API exchange, redacted, with its timing."""
+        self.recorder = ComapTraceRecorder()
+        self._retire_http()
+        return self.recorder
+
+    def stop_recording(self):
+        """Stop recording and return the recorder holding the trace."""
+        recorder, self.recorder = self.recorder, None
+        self._retire_http()
+        return recorder
+
+    def _retire_http(self):
+        if self._http is not None:
+            # In-flight requests may still use the old pool, close it once idle
+            if self._http in self._in_flight:
+                self._retired_http.append(self._http)
+            else:
+                self._close_http(self._http)
+            self._http = None
+
+    def _close_http(self, http):
+        task = asyncio.get_running_loop().create_task(http.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @asynccontextmanager
+    async def _http_session(self):
+        """Yield the current pool, counting the requests still using it."""
+        http = self._get_http()
+        self._in_flight[http] = self._in_flight.get(http, 0) + 1
         try:
-            url = "https://cognito-idp.eu-west-3.amazonaws.com"
-            login_request = httpx.post(
-                url, json=self.login_payload, headers=self.login_headers
-            )
-            login_request.raise_for_status()
-            response = login_request.json()
-            self.last_request = datetime.now()
-            self.token = response.get("AuthenticationResult").get("AccessToken")
-            self.refresh_token = response.get("AuthenticationResult").get(
-                "RefreshToken"
+            yield http
+        finally:
+            self._in_flight[http] -= 1
+            if not self._in_flight[http]:
+                del self._in_flight[http]
+                if http in self._retired_http:
+                    self._retired_http.remove(http)
+                    self._close_http(http)
+
+    def _get_http(self):
+        if self._http is None:
+            transport = self._transport
+            if transport is None:
+                transport = httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(
+                        max_connections=self._pool_size,
+                        max_keepalive_connections=self._pool_size,
+                    )
+                )
+            if self.recorder is not None:
+                transport = ComapRecordingTransport(transport, self.recorder)
+            self._http = httpx.AsyncClient(transport=transport)
+        return self._http
+
+    async def async_close(self):
+        """Close the HTTP connection pools."""
+        for http in [*self._retired_http, self._http]:
+            if http is not None:
+                await http.aclose()
+        if self._closing:
+            await asyncio.gather(*self._closing)
+        self._retired_http = []
+        self._http = None
+
+    async def async_connect(self):
+        """Open a session, resuming from the refresh token when one is known.
+
+        Falls back to a password login if Cognito rejects the refresh token.
+        """
+        await self.async_renew_token()
+        try:
+            housings = await self.async_get_housings()
+            self.housing_info = housings[0]
+            self.housing = self.housing_info.get("id")
+        except (AttributeError, IndexError) as err:
+            raise ComapClientAuthException("No housing found") from err
+
+    async def async_renew_token(self):
+        """Refresh the access token, logging in again if the refresh token is rejected."""
+        if self.refresh_token:
+            try:
+                return await self.async_token_refresh()
+            except ComapClientAuthException:
+                _LOGGER.debug("Refresh token rejected, logging in again")
+        await self.async_login()
+
+    async def async_login(self):
+        """Authenticate with username and password."""
+        async with self._http_session() as http:
+            login_request = await http.post(
+                self._AUTHURL, json=self.login_payload, headers=self.login_headers
             )
-            self.token_expires = response.get("AuthenticationResult").get("ExpiresIn")
-
-        except httpx.HTTPStatusError as err:
+        if _auth_rejected(login_request):
             _LOGGER.error(
                 "Could not set up COMAP client - %s status code. Check your credentials",
-                err.response.status_code,
+                login_request.status_code,
             )
             raise ComapClientAuthException(
-                "Client set up failed", err.response.status_code
-            ) from err
+                "Client set up failed", login_request.status_code
+            )
+        # Throttling and server errors are connection errors, not bad credentials
+        login_request.raise_for_status()
+        self._update_tokens(login_request.json())
+
+    async def async_token_refresh(self):
+        """Get a new access token from the refresh token."""
+        async with self._http_session() as http:
+            login_request = await http.post(
+                self._AUTHURL, json=self._refresh_payload(), headers=self.login_headers
+            )
+        if _auth_rejected(login_request):
+            _LOGGER.debug("Refresh token rejected")
+            raise ComapClientAuthException(
+                "Refresh token failed", login_request.status_code
+            )
+        login_request.raise_for_status()
+        self._update_tokens(login_request.json())
+
+    def _refresh_payload(self):
+        return {
+            "AuthFlow": "REFRESH_TOKEN_AUTH",
+            "AuthParameters": {"REFRESH_TOKEN": self.refresh_token},
+            "ClientId": self.clientid,
+        }
 
-    def get_request(self, url, headers=None, params={}):
-        if (datetime.now() - self.last_request).total_seconds() > (
+    def _update_tokens(self, response):
+        result = response.get("AuthenticationResult")
+        self.last_request = datetime.now()
+        self.token = result.get("AccessToken")
+        self.token_expires = result.get("ExpiresIn")
+        # Cognito only issues a refresh token on password login
+        if result.get("RefreshToken"):
+            self.refresh_token = result.get("RefreshToken")
+
+    def _token_expired(self):
+        return (datetime.now() - self.last_request).total_seconds() > (
             self.token_expires - 60
-        ):
-            self.token_refresh()
-        if headers is None:
-            headers = {
-                "Authorization": "Bearer {}".format(self.token),
-                "Content-Type": "application/json",
-            }
-        r = httpx.get(url=url, headers=headers, params=params)
-        r.raise_for_status()
-        return r.json()
+        )
 
     async def async_request(self, mode, url, headers=None, params={}, json={}):
-        if (datetime.now() - self.last_request).total_seconds() > (
-            self.token_expires - 60
-        ):
-            _LOGGER.debug("Attempting refresh of access token")
-            self.token_refresh()
+        if self._token_expired():
+            # Concurrent requests wait for a single renewal
+            async with self._token_lock:
+                if self._token_expired():
+                    _LOGGER.debug("Attempting refresh of access token")
+                    await self.async_renew_token()
         if headers is None:
             headers = {
                 "Authorization": "Bearer {}".format(self.token),
                 "Content-Type": "application/json",
             }
-        async with httpx.AsyncClient() as client:
-            if mode == "post":
-                r = await client.post(url=url, headers=headers, json=json)
-            if mode == "put":
-                r = await client.put(url=url, headers=headers, json=json)
-            elif mode == "delete":
-                r = await client.delete(url=url, headers=headers)
-            elif mode == "get":
-                r = await client.get(url=url, headers=headers, params=params)
-            r.raise_for_status()
-            return r.json()
+        if mode == "get":
+            r = await self._async_hedged_get(url, headers, params)
+        else:
+            async with (
+                self._write_semaphore,
+                self._slot(PRIORITY_WRITE),
+                self._http_session() as client,
+            ):
+                if mode == "post":
+                    r = await client.post(
+                        url=url, headers=headers, json=json, timeout=DEFAULT_TIMEOUT
+                    )
+                elif mode == "put":
+                    r = await client.put(
+                        url=url, headers=headers, json=json, timeout=DEFAULT_TIMEOUT
+                    )
+                elif mode == "delete":
+                    r = await client.delete(
+                        url=url, headers=headers, timeout=DEFAULT_TIMEOUT
+                    )
+        r.raise_for_status()
+        if not r.content:
+            return None
+        return loads(r.content)
+
+    def _slot(self, priority):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(priority)
+
+    async def _async_timed_get(self, endpoint, url, headers, params):
+        # Time spent waiting for the request budget is not endpoint latency
+        async with self._slot(PRIORITY_POLL), self._http_session() as client:
+            started = time.monotonic()
+            try:
+                r = await client.get(
+                    url=url,
+                    headers=headers,
+                    params=params,
+                    timeout=ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT),
+                )
+            except (asyncio.CancelledError, httpx.TimeoutException):
+                # Attempts overtaken by a hedge or timed out took at least this
+                # long; leaving them out would hide the tail hedging is timed on
+                self.latency.record(endpoint, time.monotonic() - started)
+                raise
+        self.latency.record(endpoint, time.monotonic() - started)
+        return r
+
+    async def _async_hedged_get(self, url, headers, params):
+        """GET a URL, sending a duplicate if the first attempt is unusually slow.
+
+        The hedge delay is the configured percentile of the latency observed
+        on the endpoint; until enough samples are collected no hedge is sent.
+        """
+        endpoint = endpoint_name(url)
+        delay = None
+        if self.hedge_percentile:
+            delay = self.latency.percentile(endpoint, self.hedge_percentile)
+        tasks = {
+            asyncio.create_task(self._async_timed_get(endpoint, url, headers, params))
+        }
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                # A hedge would only queue behind the first attempt on an
+                # exhausted budget
+                if not done and (self.scheduler is None or self.scheduler.available):
+                    _LOGGER.debug("Hedging %s request after %.2fs", endpoint, delay)
+                    tasks.add(
+                        asyncio.create_task(
+                            self._async_timed_get(endpoint, url, headers, params)
+                        )
+                    )
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
 
     async def async_post(self, url, headers=None, json={}):
         return await self.async_request("post", url, headers, json=json)
@@ -112,35 +360,8 @@ class ComapClient(object):
     async def async_put(self, url, headers=None, json={}):
         return await self.async_request("put", url, headers, json=json)
 
-    def token_refresh(self):
-        url = "https://cognito-idp.eu-west-3.amazonaws.com"
-
-        with _TOKEN_LOCK:
-            headers = {
-                "Content-Type": "application/x-amz-json-1.1",
-                "x-amz-target": "AWSCognitoIdentityProviderService.InitiateAuth",
-                "origin": "https://app.comapsmarthome.com",
-                "referer": "https://app.comapsmarthome.com",
-            }
-            payload = {
-                "AuthFlow": "REFRESH_TOKEN_AUTH",
-                "AuthParameters": {"REFRESH_TOKEN": self.refresh_token},
-                "ClientId": self.clientid,
-            }
-
-            login_request = httpx.post(url, json=payload, headers=headers)
-            if login_request.status_code == 200:
-                response = login_request.json()
-                self.last_request = datetime.now()
-                self.token = response.get("AuthenticationResult").get("AccessToken")
-                self.token_expires = response.get("AuthenticationResult").get(
-                    "ExpiresIn"
-                )
-            else:
-                _LOGGER.error("Refresh token failed")
-
-    def get_housings(self):
-        return self.get_request(self._BASEURL + "park/housings")
+    async def async_get_housings(self):
+        return await self.async_get(self._BASEURL + "park/housings")
 
     async def get_zones(self, housing=None):
         if housing is None:
@@ -149,10 +370,10 @@ class ComapClient(object):
             self._BASEURL + "thermal/housings/" + housing + "/thermal-details"
         )
 
-    def get_zone(self, zoneid, housing=None):
+    async def async_get_zone(self, zoneid, housing=None):
         if housing is None:
             housing = self.housing
-        return self.get_request(
+        return await self.async_get(
             self._BASEURL
             + "thermal/housings/"
             + housing
@@ -254,40 +475,54 @@ class ComapClient(object):
         )
 
     async def set_temporary_instruction(
-        self, zone, instruction, duration=120, housing=None
+        self, zone, instruction, duration=120, housing=None, active=None
     ):
-        """Set a temporary instruction for a zone, for a given duration in minutes."""
+        """Set a temporary instruction for a zone, for a given duration in minutes.
+
+        ``active`` tells whether the zone already runs a temporary instruction,
+        as last seen in the zone data. The API refuses to override one with a
+        409, so a known active instruction is removed first; when unknown, the
+        instruction is posted and removed once on conflict.
+        """
         if housing is None:
             housing = self.housing
         data = {"duration": duration, "set_point": {"instruction": instruction}}
+        url = (
+            self._BASEURL
+            + "thermal/housings/"
+            + housing
+            + "/thermal-control/zones/"
+            + zone
+            + "/temporary-instruction"
+        )
 
+        if active:
+            await self.remove_temporary_instruction(zone, housing)
         try:
-            r = await self.async_post(
-                self._BASEURL
-                + "thermal/housings/"
-                + housing
-                + "/thermal-control/zones/"
-                + zone
-                + "/temporary-instruction",
-                json=data,
-            )
-            return r
+            return await self.async_post(url, json=data)
+        except httpx.HTTPStatusError as err:
+            if err.response.status_code != 409:
+                raise
+        # The zone state was stale or unknown, remove the instruction and retry once
+        await self.remove_temporary_instruction(zone, housing)
+        try:
+            return await self.async_post(url, json=data)
         except httpx.HTTPStatusError as err:
             if err.response.status_code == 409:
-                await self.remove_temporary_instruction(zone, housing)
-                return await self.set_temporary_instruction(
-                    zone, instruction, duration=duration, housing=housing
-                )
-            else:
-                raise err
+                raise ComapClientConflictException(
+                    "Temporary instruction for zone {} still conflicts after removal".format(
+                        zone
+                    )
+                ) from err
+            raise
 
     async def remove_temporary_instruction(self, zone, housing=None):
-        """Set a temporary instruction for a zone, for a given duration in minutes."""
+        """Remove the temporary instruction of a zone, if any."""
         if housing is None:
             housing = self.housing
 
         try:
-            r = await self.async_delete(
+            return await self.async_delete(
                 self._BASEURL
                 + "thermal/housings/"
                 + housing
@@ -295,9 +530,11 @@ class ComapClient(object):
                 + zone
                 + "/temporary-instruction",
             )
-            return r
         except httpx.HTTPStatusError as err:
-            _LOGGER.error(err)
+            # Nothing to remove
+            if err.response.status_code == 404:
+                return None
+            raise
 
     async def turn_on(self, housing=None):
         data = {"state": "on"}
@@ -324,9 +561,26 @@ class ComapClient(object):
         )
 
 
+def _auth_rejected(response):
+    """Return True if Cognito rejected the credentials or refresh token."""
+    if response.status_code == 401:
+        return True
+    if response.status_code != 400:
+        return False
+    try:
+        error = response.json().get("__type", "")
+    except ValueError:
+        return True
+    return error.rsplit("#", 1)[-1] in AUTH_REJECTED_ERRORS
+
+
 class ComapClientException(Exception):
     """Exception with ComapSmartHome client."""
 
 
-class ComapClientAuthException(Exception):
-    """Exception with ComapSmartHome client."""
+class ComapClientAuthException(ComapClientException):
+    """Authentication rejected by ComapSmartHome."""
+
+
+class ComapClientConflictException(ComapClientException):
+    """Request conflicting with the current state of a zone."""
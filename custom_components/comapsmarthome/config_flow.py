@@ -1,41 +1,165 @@
 """Config flow to configure Comap smart home."""
+from collections.abc import Mapping
 import logging
+from typing import Any
 
-from .comap import ComapClient, ComapClientException
+import httpx
+
+from .comap import ComapClient, ComapClientAuthException, ComapClientException
 import voluptuous as vol
 
 from homeassistant import config_entries
-from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.const import CONF_PASSWORD, CONF_SCAN_INTERVAL, CONF_USERNAME
+from homeassistant.core import callback
 
-from .const import DOMAIN
+from . import get_entry_options
+from .const import (
+    CONF_HEDGE_PERCENTILE,
+    CONF_POOL_SIZE,
+    CONF_PRESENCE_WINDOW,
+    CONF_REFRESH_TOKEN,
+    CONF_SCHEDULE_BASELINE_INTERVAL,
+    CONF_SENSOR_SCAN_INTERVAL,
+    CONF_TIMEOUT,
+    CONF_WRITE_CONCURRENCY,
+    DOMAIN,
+)
 
 DATA_SCHEMA = vol.Schema(
     {vol.Required(CONF_USERNAME): str, vol.Required(CONF_PASSWORD): str}
 )
 
+REAUTH_SCHEMA = vol.Schema({vol.Required(CONF_PASSWORD): str})
+
+# Bounds for each tunable, durations in seconds
+OPTIONS_RANGE = {
+    CONF_SCAN_INTERVAL: (10, None),
+    CONF_TIMEOUT: (1, None),
+    CONF_PRESENCE_WINDOW: (10, None),
+    CONF_SENSOR_SCAN_INTERVAL: (10, None),
+    CONF_POOL_SIZE: (1, None),
+    CONF_WRITE_CONCURRENCY: (1, None),
+    CONF_SCHEDULE_BASELINE_INTERVAL: (30, None),
+    # 0 disables hedging
+    CONF_HEDGE_PERCENTILE: (0, 99),
+}
+
 _LOGGER = logging.getLogger(__name__)
 
 
+async def validate_input(username: str, password: str) -> str:
+    """Log in with the given credentials and return the refresh token."""
+    client = ComapClient(username=username, password=password)
+    try:
+        await client.async_login()
+    except httpx.HTTPError as err:
+        raise ComapClientException from err
+    finally:
+        await client.async_close()
+    return client.refresh_token
+
+
 class ComapFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a ComapSmartHome config flow."""
 
     VERSION = 1
 
+    _reauth_entry: config_entries.ConfigEntry | None = None
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Get the options flow for this handler."""
+        return ComapOptionsFlowHandler(config_entry)
+
     async def async_step_user(self, user_input=None):
         """Handle a flow initialized by the user."""
         errors = {}
         if user_input is not None:
+            self._async_abort_entries_match(
+                {CONF_USERNAME: user_input[CONF_USERNAME]}
+            )
             try:
-                self._async_abort_entries_match(
-                    {CONF_USERNAME: user_input[CONF_USERNAME]}
+                refresh_token = await validate_input(
+                    user_input[CONF_USERNAME], user_input[CONF_PASSWORD]
                 )
-                client = ComapClient(username=user_input[CONF_USERNAME],password=user_input[CONF_PASSWORD])
-
+            except ComapClientAuthException:
+                errors["base"] = "invalid_auth"
             except ComapClientException:
                 errors["base"] = "cannot_connect"
             else:
-                return self.async_create_entry(title=DOMAIN, data=user_input)
+                return self.async_create_entry(
+                    title=DOMAIN,
+                    data={**user_input, CONF_REFRESH_TOKEN: refresh_token},
+                )
 
         return self.async_show_form(
             step_id="user", data_schema=DATA_SCHEMA, errors=errors
-        )
\ No newline at end of file
+        )
+
+    async def async_step_reauth(self, entry_data: Mapping[str, Any]):
+        """Handle a rejected session or password."""
+        self._reauth_entry = self.hass.config_entries.async_get_entry(
+            self.context["entry_id"]
+        )
+        return await self.async_step_reauth_confirm()
+
+    async def async_step_reauth_confirm(self, user_input=None):
+        """Ask for the account password again."""
+        errors = {}
+        username = self._reauth_entry.data[CONF_USERNAME]
+        if user_input is not None:
+            try:
+                refresh_token = await validate_input(
+                    username, user_input[CONF_PASSWORD]
+                )
+            except ComapClientAuthException:
+                errors["base"] = "invalid_auth"
+            except ComapClientException:
+                errors["base"] = "cannot_connect"
+            else:
+                self.hass.config_entries.async_update_entry(
+                    self._reauth_entry,
+                    data={
+                        **self._reauth_entry.data,
+                        CONF_PASSWORD: user_input[CONF_PASSWORD],
+                        CONF_REFRESH_TOKEN: refresh_token,
+                    },
+                )
+                await self.hass.config_entries.async_reload(
+                    self._reauth_entry.entry_id
+                )
+                return self.async_abort(reason="reauth_successful")
+
+        return self.async_show_form(
+            step_id="reauth_confirm",
+            data_schema=REAUTH_SCHEMA,
+            description_placeholders={CONF_USERNAME: username},
+            errors=errors,
+        )
+
+
+class ComapOptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle ComapSmartHome runtime tunables."""
+
+    def __init__(self, entry: config_entries.ConfigEntry) -> None:
+        # Kept under our own name, config_entry is only set by recent releases
+        self._entry = entry
+
+    async def async_step_init(self, user_input=None):
+        """Manage the options."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = get_entry_options(self._entry)
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(key, default=options[key]): vol.All(
+                        vol.Coerce(int), vol.Range(min=minimum, max=maximum)
+                    )
+                    for key, (minimum, maximum) in OPTIONS_RANGE.items()
+                }
+            ),
+        )
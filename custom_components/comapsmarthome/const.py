@@ -6,3 +6,44 @@ SERVICE_SET_AWAY = "set_away"
 SERVICE_SET_HOME = "set_home"
 SERVICE_SET_SCHEDULE = "set_schedule"
 ATTR_SCHEDULE_NAME = "schedule_name"
+CONF_REFRESH_TOKEN = "refresh_token"
+
+CONF_TIMEOUT = "timeout"
+CONF_PRESENCE_WINDOW = "presence_window"
+CONF_SENSOR_SCAN_INTERVAL = "sensor_scan_interval"
+CONF_POOL_SIZE = "pool_size"
+CONF_WRITE_CONCURRENCY = "write_concurrency"
+CONF_SCHEDULE_BASELINE_INTERVAL = "schedule_baseline_interval"
+CONF_HEDGE_PERCENTILE = "hedge_percentile"
+
+# Durations are in seconds
+DEFAULT_SCAN_INTERVAL = 30
+DEFAULT_TIMEOUT = 10
+DEFAULT_PRESENCE_WINDOW = 120
+DEFAULT_SENSOR_SCAN_INTERVAL = 60
+DEFAULT_POOL_SIZE = 10
+DEFAULT_WRITE_CONCURRENCY = 4
+DEFAULT_SCHEDULE_BASELINE_INTERVAL = 300
+DEFAULT_HEDGE_PERCENTILE = 95
+
+# Process wide request budget, shared by every entry
+DATA_SCHEDULER = DOMAIN + "_scheduler"
+# Client and journal of each account set up from YAML, by username
+DATA_YAML_SESSIONS = DOMAIN + "_yaml_sessions"
+REQUEST_RATE = 2
+REQUEST_BURST = 20
+# Random delay added to each poll, as a share of the interval and at most in seconds
+POLL_JITTER = 0.1
+MAX_POLL_JITTER = 15
+
+SIGNAL_OPTIONS_UPDATED = DOMAIN + "_options_updated_{}"
+# Sent with the zone id once a zone's device is removed from an entry
+SIGNAL_ZONE_REMOVED = DOMAIN + "_zone_removed_{}"
+
+SERVICE_START_TRACE = "start_trace"
+SERVICE_STOP_TRACE = "stop_trace"
+SERVICE_PROFILE = "profile"
+SERVICE_GET_SNAPSHOT = "get_snapshot"
+ATTR_CYCLES = "cycles"
+ATTR_HOUSING = "housing"
+EVENT_COMMAND_RESULT = DOMAIN + "_command_result"
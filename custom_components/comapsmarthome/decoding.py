@@ -0,0 +1,41 @@
+"""JSON decoding of API responses, trimmed to the fields the integration reads."""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Zone fields read by the entities or exposed as their attributes
+ZONE_FIELDS = (
+    "id",
+    "title",
+    "temperature",
+    "humidity",
+    "heating_status",
+    "set_point",
+    "set_point_type",
+    "temporary_instruction",
+    "schedule_id",
+    "next_timeslot",
+    "open_window",
+    "last_transmission",
+    "kids_lock",
+    "last_presence_detected",
+)
+
+
+def loads(content):
+    """Decode a JSON response body, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def trim_zone(zone, schedule=None):
+    """Return the used fields of a thermal-details zone, overlaid with its active schedule."""
+    trimmed = {key: zone[key] for key in ZONE_FIELDS if key in zone}
+    if schedule:
+        trimmed.update({key: schedule[key] for key in ZONE_FIELDS if key in schedule})
+    return trimmed
+
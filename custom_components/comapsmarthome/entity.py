@@ -0,0 +1,61 @@
+"""Shared entity helpers for ComapSmartHome."""
+from datetime import timedelta
+
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import SIGNAL_OPTIONS_UPDATED
+
+
+class ComapPolledEntity(Entity):
+    """Entity refreshed on its own timer, with the interval taken from the entry options.
+
+    Subclasses set ``_scan_interval_option`` to the option key holding their interval.
+    """
+
+    _attr_should_poll = False
+    _scan_interval_option: str
+
+    def __init__(self, entry_id, scan_interval) -> None:
+        super().__init__()
+        self._entry_id = entry_id
+        self._scan_interval = timedelta(seconds=scan_interval)
+        self._unsub_update = None
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self._async_track_updates()
+        self.async_on_remove(self._async_cancel_updates)
+        if self._entry_id is not None:
+            self.async_on_remove(
+                async_dispatcher_connect(
+                    self.hass,
+                    SIGNAL_OPTIONS_UPDATED.format(self._entry_id),
+                    self._async_options_updated,
+                )
+            )
+
+    @callback
+    def _async_track_updates(self) -> None:
+        self._async_cancel_updates()
+        self._unsub_update = async_track_time_interval(
+            self.hass, self._async_scheduled_update, self._scan_interval
+        )
+
+    @callback
+    def _async_cancel_updates(self) -> None:
+        if self._unsub_update is not None:
+            self._unsub_update()
+            self._unsub_update = None
+
+    @callback
+    def _async_options_updated(self, options) -> None:
+        scan_interval = timedelta(seconds=options[self._scan_interval_option])
+        if scan_interval != self._scan_interval:
+            self._scan_interval = scan_interval
+            self._async_track_updates()
+
+    async def _async_scheduled_update(self, now=None) -> None:
+        await self.async_update_ha_state(force_refresh=True)
@@ -0,0 +1,83 @@
+"""Incremental heating runtime statistics, updated from each coordinator refresh."""
+
+# Rolling duty cycle windows, in seconds
+DUTY_CYCLE_WINDOWS = (3600, 86400)
+WINDOW_BUCKETS = 24
+
+
+class _RollingWindow:
+    """Heating and observed seconds over a sliding window, in fixed buckets."""
+
+    def __init__(self, length, buckets=WINDOW_BUCKETS):
+        self.length = length
+        self.width = length / buckets
+        self._ids = [None] * buckets
+        self._on = [0.0] * buckets
+        self._seen = [0.0] * buckets
+
+    def add(self, start, end, heating):
+        start = max(start, end - self.length)
+        while start < end:
+            bucket = int(start // self.width)
+            stop = min(end, (bucket + 1) * self.width)
+            index = bucket % len(self._ids)
+            if self._ids[index] != bucket:
+                self._ids[index] = bucket
+                self._on[index] = 0.0
+                self._seen[index] = 0.0
+            self._seen[index] += stop - start
+            if heating:
+                self._on[index] += stop - start
+            start = stop
+
+    def ratio(self, now):
+        """Return the heating share of the observed time, None if nothing observed."""
+        current = int(now // self.width)
+        oldest = current - len(self._ids)
+        on = seen = 0.0
+        for index, bucket in enumerate(self._ids):
+            if bucket is not None and oldest < bucket <= current:
+                on += self._on[index]
+                seen += self._seen[index]
+        if not seen:
+            return None
+        return on / seen
+
+
+class ComapHeatingStats:
+    """Heating on-time, transitions and duty cycles of a zone, in constant memory.
+
+    The heating status seen at a refresh is assumed to hold until the next one,
+    unless they are further apart than ``max_gap`` seconds: the time between is
+    then left unobserved rather than booked to a status that may have changed.
+    """
+
+    def __init__(self):
+        self.heating = None
+        self.last_update = None
+        self.on_time = 0.0
+        self.transitions = 0
+        self.windows = {length: _RollingWindow(length) for length in DUTY_CYCLE_WINDOWS}
+
+    def update(self, heating, now, max_gap=None):
+        """Account for the time since the last update and record the new status."""
+        if (
+            self.last_update is not None
+            and now > self.last_update
+            and (max_gap is None or now - self.last_update <= max_gap)
+        ):
+            if self.heating:
+                self.on_time += now - self.last_update
+            for window in self.windows.values():
+                window.add(self.last_update, now, self.heating)
+        if self.heating is not None and heating != self.heating:
+            self.transitions += 1
+        self.heating = heating
+        self.last_update = now
+
+    def duty_cycle(self, length, now):
+        """Return the heating percentage over the window, None until observed."""
+        ratio = self.windows[length].ratio(now)
+        if ratio is None:
+            return None
+        return round(ratio * 100, 1)
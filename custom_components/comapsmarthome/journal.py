@@ -0,0 +1,177 @@
+"""Persisted journal of outbound commands, replayed once the Comap cloud is back."""
+import asyncio
+import logging
+import uuid
+
+import httpx
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import EVENT_COMMAND_RESULT
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+RETRY_DELAY = 30
+
+# Arguments describing the zone state at submission, stale by replay time
+STATE_HINTS = {"active"}
+
+# Commands sharing a group on the same zone or housing supersede each other
+COMMAND_GROUPS = {
+    "set_temporary_instruction": ("zone", "instruction"),
+    "remove_temporary_instruction": ("zone", "instruction"),
+    "set_schedule": ("zone", "schedule"),
+    "leave_home": ("housing", "presence"),
+    "return_home": ("housing", "presence"),
+    "away_return": ("housing", "presence"),
+    "turn_on": ("housing", "heating"),
+    "turn_off": ("housing", "heating"),
+}
+
+
+def is_unreachable(err):
+    """Return True if an error means the cloud is unreachable rather than the command invalid."""
+    if isinstance(err, httpx.HTTPStatusError):
+        return err.response.status_code >= 500 or err.response.status_code == 429
+    return isinstance(err, (httpx.TransportError, asyncio.TimeoutError))
+
+
+async def async_remove_journal(hass: HomeAssistant, storage_key):
+    """Delete a stored journal, once its entry is removed."""
+    await Store(hass, STORAGE_VERSION, storage_key).async_remove()
+
+
+class ComapCommandJournal:
+    """Queue of commands that could not reach the Comap cloud.
+
+    Commands are sent straight away while the cloud answers. Once a command
+    fails for lack of connectivity, it and every following command are
+    journaled, keeping only the latest per zone or housing and group, and
+    replayed in submission order when the cloud is back.
+    """
+
+    def __init__(self, hass: HomeAssistant, client, storage_key):
+        self.hass = hass
+        self.client = client
+        self._store = Store(hass, STORAGE_VERSION, storage_key)
+        self._commands: dict[str, dict] = {}
+        self._unsub_retry = None
+        self._replaying = None
+        self._stopped = False
+
+    @property
+    def pending(self):
+        return list(self._commands.values())
+
+    async def async_load(self):
+        """Restore journaled commands and schedule their replay."""
+        stored = await self._store.async_load()
+        for command in stored or []:
+            self._commands[command["key"]] = command
+        if self._commands:
+            _LOGGER.info("Replaying %s journaled Comap commands", len(self._commands))
+            self._async_schedule_retry(0)
+
+    async def async_shutdown(self):
+        """Stop replaying, before the client is closed.
+
+        Commands of an interrupted replay stay journaled and are replayed
+        after the next start.
+        """
+        self._stopped = True
+        if self._unsub_retry is not None:
+            self._unsub_retry()
+            self._unsub_retry = None
+        replaying = self._replaying
+        if replaying is not None and replaying is not asyncio.current_task():
+            replaying.cancel()
+            await asyncio.wait([replaying])
+
+    async def async_submit(self, command, **kwargs):
+        """Send a command, or journal it while the cloud is unreachable.
+
+        Returns True if the command was sent, False if it was journaled.
+        """
+        scope, group = COMMAND_GROUPS[command]
+        kwargs.setdefault("housing", self.client.housing)
+        entry = {
+            "id": uuid.uuid4().hex,
+            "command": command,
+            "kwargs": kwargs,
+            "key": "/".join(
+                [kwargs["housing"], kwargs["zone"], group]
+                if scope == "zone"
+                else [kwargs["housing"], group]
+            ),
+            "queued_at": dt_util.utcnow().isoformat(),
+        }
+        if not self._commands:
+            try:
+                await self._async_send(entry)
+                return True
+            except (httpx.HTTPError, asyncio.TimeoutError) as err:
+                if not is_unreachable(err):
+                    raise
+                _LOGGER.warning("Comap cloud unreachable, journaling %s", command)
+        for hint in STATE_HINTS:
+            kwargs.pop(hint, None)
+        self._commands.pop(entry["key"], None)
+        self._commands[entry["key"]] = entry
+        await self._store.async_save(self.pending)
+        self._async_schedule_retry(RETRY_DELAY)
+        return False
+
+    async def _async_send(self, entry):
+        return await getattr(self.client, entry["command"])(**entry["kwargs"])
+
+    @callback
+    def _async_schedule_retry(self, delay):
+        if (
+            self._stopped
+            or self._unsub_retry is not None
+            or self._replaying is not None
+        ):
+            return
+        self._unsub_retry = async_call_later(self.hass, delay, self._async_retry)
+
+    async def _async_retry(self, now=None):
+        self._unsub_retry = None
+        self._replaying = asyncio.current_task()
+        try:
+            await self.async_replay()
+        finally:
+            self._replaying = None
+        if self._commands:
+            self._async_schedule_retry(RETRY_DELAY)
+
+    async def async_replay(self):
+        """Send journaled commands in order; the client bounds write concurrency."""
+        commands = self.pending
+        results = await asyncio.gather(
+            *(self._async_send(entry) for entry in commands), return_exceptions=True
+        )
+        for entry, result in zip(commands, results):
+            if isinstance(result, Exception) and is_unreachable(result):
+                continue
+            # Leave the journal alone if a newer command superseded this one
+            if self._commands.get(entry["key"], {}).get("id") == entry["id"]:
+                del self._commands[entry["key"]]
+            success = not isinstance(result, Exception)
+            if not success:
+                _LOGGER.error("Journaled %s failed: %s", entry["command"], result)
+            self.hass.bus.async_fire(
+                EVENT_COMMAND_RESULT,
+                {
+                    "id": entry["id"],
+                    "command": entry["command"],
+                    **{k: v for k, v in entry["kwargs"].items() if k != "housing"},
+                    "queued_at": entry["queued_at"],
+                    "success": success,
+                    "error": None if success else str(result),
+                },
+            )
+        await self._store.async_save(self.pending)
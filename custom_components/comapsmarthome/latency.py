@@ -0,0 +1,34 @@
+"""Observed request latency, used to decide when to hedge a slow read."""
+from collections import defaultdict, deque
+from math import ceil
+
+
+class ComapLatencyTracker:
+    """Rolling window of response times per API endpoint."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, endpoint, seconds):
+        self._samples[endpoint].append(seconds)
+
+    def percentile(self, endpoint, percentile):
+        """Return the latency percentile for an endpoint, or None while still learning."""
+        samples = self._samples.get(endpoint)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, ceil(percentile / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def stats(self):
+        """Return sample count, p50 and p99 per endpoint."""
+        return {
+            endpoint: {
+                "samples": len(samples),
+                "p50": self.percentile(endpoint, 50),
+                "p99": self.percentile(endpoint, 99),
+            }
+            for endpoint, samples in self._samples.items()
+        }
@@ -0,0 +1,180 @@
+"""Debug instrumentation of the Comap client and refresh profiling."""
+import cProfile
+from collections import defaultdict
+import functools
+import inspect
+import io
+import logging
+import pstats
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Calls holding the event loop thread longer than this in one go are reported
+# as blocking, the same threshold Home Assistant uses for slow callbacks
+BLOCKING_THRESHOLD = 0.1
+
+
+class ComapCallStats:
+    """Timing of instrumented calls, with the time they spent running on the event loop."""
+
+    def __init__(self, loop_thread_id):
+        self.loop_thread_id = loop_thread_id
+        self.calls = defaultdict(
+            lambda: {"count": 0, "total": 0.0, "max": 0.0, "loop": 0.0, "longest": 0.0}
+        )
+        self.blocking = defaultdict(list)
+
+    def record(self, name, elapsed, loop_time, longest):
+        """Record a call lasting ``elapsed`` seconds.
+
+        ``loop_time`` is the part spent running on the event loop thread and
+        ``longest`` the longest stretch it held the loop without yielding.
+        """
+        call = self.calls[name]
+        call["count"] += 1
+        call["total"] += elapsed
+        call["max"] = max(call["max"], elapsed)
+        call["loop"] += loop_time
+        call["longest"] = max(call["longest"], longest)
+        if longest >= BLOCKING_THRESHOLD:
+            self.blocking[name].append(longest)
+            _LOGGER.warning("%s blocked the event loop for %.3fs", name, longest)
+
+    def report(self):
+        """Return a plain text summary of the recorded calls."""
+        lines = [
+            "{:<40}{:>8}{:>12}{:>12}{:>12}{:>14}{:>10}".format(
+                "call",
+                "count",
+                "total (s)",
+                "max (s)",
+                "loop (s)",
+                "longest (s)",
+                "blocked",
+            )
+        ]
+        for name, call in sorted(
+            self.calls.items(), key=lambda item: item[1]["loop"], reverse=True
+        ):
+            lines.append(
+                "{:<40}{:>8}{:>12.3f}{:>12.3f}{:>12.3f}{:>14.3f}{:>10}".format(
+                    name,
+                    call["count"],
+                    call["total"],
+                    call["max"],
+                    call["loop"],
+                    call["longest"],
+                    len(self.blocking.get(name, [])),
+                )
+            )
+        return "\n".join(lines)
+
+
+def instrument_client(client, stats):
+    """Time every public client method, with the time it holds the event loop."""
+    for name, method in inspect.getmembers(client, inspect.ismethod):
+        if name.startswith("_"):
+            continue
+        setattr(client, name, _wrap(f"ComapClient.{name}", method, stats))
+
+
+def instrument_coordinator(coordinator, stats):
+    """Time coordinator refreshes, including decoding, trimming and trend fits."""
+    coordinator._async_update_data = _wrap(
+        "ComapCoordinator.refresh", coordinator._async_update_data, stats
+    )
+
+
+def _wrap(name, method, stats):
+    if inspect.iscoroutinefunction(method):
+        return _wrap_async(name, method, stats)
+    return _wrap_sync(name, method, stats)
+
+
+class _LoopTimer:
+    """Await a coroutine, timing each step it runs on the event loop.
+
+    A step lasts from one resumption of the coroutine to its next suspension,
+    during which nothing else can run on the loop.
+    """
+
+    def __init__(self, coro):
+        self._coro = coro
+        self.total = 0.0
+        self.longest = 0.0
+
+    def __await__(self):
+        send, value = self._coro.send, None
+        while True:
+            started = time.monotonic()
+            try:
+                future = send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                step = time.monotonic() - started
+                self.total += step
+                self.longest = max(self.longest, step)
+            try:
+                value = yield future
+            except BaseException as err:
+                send, value = self._coro.throw, err
+            else:
+                send = self._coro.send
+
+
+def _wrap_async(name, method, stats):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        timer = _LoopTimer(method(*args, **kwargs))
+        try:
+            return await timer
+        finally:
+            stats.record(name, time.monotonic() - started, timer.total, timer.longest)
+
+    return wrapper
+
+
+def _wrap_sync(name, method, stats):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.monotonic() - started
+            loop_time = elapsed if threading.get_ident() == stats.loop_thread_id else 0
+            stats.record(name, elapsed, loop_time, loop_time)
+
+    return wrapper
+
+
+async def async_profile(cycles, run_cycle):
+    """Profile ``cycles`` awaits of ``run_cycle``, returning the profiler and wall times."""
+    profiler = cProfile.Profile()
+    durations = []
+    profiler.enable()
+    try:
+        for _ in range(cycles):
+            started = time.monotonic()
+            await run_cycle()
+            durations.append(time.monotonic() - started)
+    finally:
+        profiler.disable()
+    return profiler, durations
+
+
+def profile_report(profiler, durations, sections):
+    """Return a text report: cycle times, extra sections and the top cumulative calls."""
+    out = io.StringIO()
+    out.write("Cycle durations (s): ")
+    out.write(", ".join(f"{duration:.3f}" for duration in durations))
+    out.write("\n\n")
+    for title, body in sections:
+        out.write(f"== {title} ==\n{body}\n\n")
+    out.write("== Profile (cumulative) ==\n")
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(50)
+    return out.getvalue()
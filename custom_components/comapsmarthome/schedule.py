@@ -0,0 +1,98 @@
+"""Local timeline of upcoming schedule transitions, used to time coordinator refreshes."""
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+MINUTES_PER_WEEK = 7 * 24 * 60
+
+
+def parse_clock(value):
+    """Return minutes since midnight for an "HH:MM" or "HH:MM:SS" string."""
+    hours, minutes = value.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_next_timeslot(value, now):
+    """Return the start of a zone's next_timeslot as an aware datetime, if known."""
+    if isinstance(value, dict):
+        value = value.get("begin_at")
+    if not isinstance(value, str):
+        return None
+    try:
+        begin = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            minutes = parse_clock(value)
+        except ValueError:
+            return None
+        begin = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(
+            minutes=minutes
+        )
+        if begin <= now:
+            begin += timedelta(days=1)
+        return begin
+    if begin.tzinfo is None:
+        begin = begin.replace(tzinfo=now.tzinfo)
+    return begin
+
+
+def schedule_transitions(schedule):
+    """Return the sorted minutes-of-week at which a schedule changes set point.
+
+    ``day_timeslots`` holds one entry per weekday, Monday first.
+    """
+    transitions = set()
+    for day, day_timeslots in enumerate(schedule.get("day_timeslots") or []):
+        for timeslot in day_timeslots.get("timeslots") or []:
+            try:
+                minutes = parse_clock(timeslot["begin_at"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            transitions.add(day * 24 * 60 + minutes)
+    return sorted(transitions)
+
+
+class ComapScheduleTimeline:
+    """Upcoming set point transitions for each zone of a housing."""
+
+    def __init__(self):
+        self.transitions: dict[str, list[int]] = {}
+        self.next_timeslots: dict[str, datetime] = {}
+        self._merged: list[int] = []
+
+    def update(self, zones, schedules, now):
+        """Rebuild the timeline from zone data and the housing schedules.
+
+        ``zones`` maps zone id to zone data carrying ``schedule_id`` and
+        ``next_timeslot``, as kept by the coordinator.
+        """
+        by_id = {schedule.get("id"): schedule for schedule in schedules or []}
+        transitions = {}
+        next_timeslots = {}
+        for zone_id, zone in zones.items():
+            schedule = by_id.get(zone.get("schedule_id"))
+            if schedule is not None:
+                transitions[zone_id] = schedule_transitions(schedule)
+            next_timeslot = parse_next_timeslot(zone.get("next_timeslot"), now)
+            if next_timeslot is not None:
+                next_timeslots[zone_id] = next_timeslot
+        self.transitions = transitions
+        self.next_timeslots = next_timeslots
+        self._merged = sorted({m for slots in transitions.values() for m in slots})
+
+    def next_transition(self, now):
+        """Return the earliest transition strictly after ``now`` across all zones."""
+        candidates = [begin for begin in self.next_timeslots.values() if begin > now]
+        if self._merged:
+            minute = now.weekday() * 24 * 60 + now.hour * 60 + now.minute
+            index = bisect_right(self._merged, minute)
+            if index < len(self._merged):
+                delta = self._merged[index] - minute
+            else:
+                delta = self._merged[0] + MINUTES_PER_WEEK - minute
+            candidates.append(
+                now.replace(second=0, microsecond=0) + timedelta(minutes=delta)
+            )
+        return min(candidates, default=None)
@@ -0,0 +1,80 @@
+"""Process wide request budget shared by every Comap client."""
+import asyncio
+from contextlib import asynccontextmanager
+import heapq
+import itertools
+import time
+
+PRIORITY_WRITE = 0
+PRIORITY_POLL = 1
+
+# Golden ratio conjugate, spreads successive poll phases evenly over a period
+_PHASE_STEP = 0.6180339887
+
+
+class ComapRequestScheduler:
+    """Token bucket handing out request slots, writes before background reads.
+
+    ``rate`` tokens are added per second up to ``burst``. When the bucket is
+    empty requests wait, and waiting writes are always served before
+    waiting polls.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._pollers = 0
+
+    def next_phase(self):
+        """Return the phase, as a fraction of the poll interval, for a new poller."""
+        phase = (self._pollers * _PHASE_STEP) % 1
+        self._pollers += 1
+        return phase
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self):
+        """Return True if a request could start right away."""
+        self._refill()
+        return self._tokens >= 1 and not self._waiters
+
+    async def acquire(self, priority=PRIORITY_POLL):
+        self._refill()
+        if self._tokens >= 1 and not self._waiters:
+            self._tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        await future
+
+    def _dispatch(self):
+        self._wakeup = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Cancelled while waiting
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self._waiters and self._wakeup is None:
+            self._wakeup = asyncio.get_running_loop().call_later(
+                (1 - self._tokens) / self.rate, self._dispatch
+            )
+
+    @asynccontextmanager
+    async def slot(self, priority=PRIORITY_POLL):
+        await self.acquire(priority)
+        yield
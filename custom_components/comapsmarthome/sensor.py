@@ -1,32 +1,46 @@
-from datetime import timedelta
 import logging
 from typing import Any, Optional
 
 import voluptuous as vol
 
-from homeassistant.components.sensor import PLATFORM_SCHEMA as SENSOR_PLATFORM_SCHEMA
+from homeassistant.components.sensor import (
+    PLATFORM_SCHEMA as SENSOR_PLATFORM_SCHEMA,
+    RestoreSensor,
+    SensorDeviceClass,
+    SensorStateClass,
+)
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_PASSWORD, CONF_SCAN_INTERVAL, CONF_USERNAME
-from homeassistant.core import HomeAssistant
+from homeassistant.const import (
+    CONF_PASSWORD,
+    CONF_SCAN_INTERVAL,
+    CONF_USERNAME,
+    PERCENTAGE,
+    UnitOfTime,
+)
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.device_registry import DeviceInfo
-from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.util import dt as dt_util
 
+from . import ComapCoordinator, async_get_yaml_session, get_entry_options
 from .comap import ComapClient
 from .const import (
     ATTR_ADDRESS,
     ATTR_AVL_SCHDL,
+    CONF_SENSOR_SCAN_INTERVAL,
     DOMAIN,
-    SERVICE_SET_AWAY,
-    SERVICE_SET_HOME,
+    SIGNAL_ZONE_REMOVED,
 )
+from .entity import ComapPolledEntity
+from .heating import DUTY_CYCLE_WINDOWS
+from .services import async_register_housing_services
 
 _LOGGER = logging.getLogger(__name__)
 
-SCAN_INTERVAL = timedelta(minutes=1)
-
 SENSOR_PLATFORM_SCHEMA = SENSOR_PLATFORM_SCHEMA.extend(
     {
         vol.Required(CONF_USERNAME): cv.string,
@@ -35,50 +49,135 @@ SENSOR_PLATFORM_SCHEMA = SENSOR_PLATFORM_SCHEMA.extend(
     }
 )
 
+HEATING_SENSORS = {
+    "heating_time": {
+        "name": "heating time",
+        "device_class": SensorDeviceClass.DURATION,
+        "state_class": SensorStateClass.TOTAL_INCREASING,
+        "unit": UnitOfTime.HOURS,
+    },
+    "heating_transitions": {
+        "name": "heating cycles",
+        "device_class": None,
+        "state_class": SensorStateClass.TOTAL_INCREASING,
+        "unit": None,
+    },
+    **{
+        f"duty_cycle_{window}": {
+            "name": f"heating duty cycle {window // 3600}h",
+            "device_class": None,
+            "state_class": SensorStateClass.MEASUREMENT,
+            "unit": PERCENTAGE,
+        }
+        for window in DUTY_CYCLE_WINDOWS
+    },
+}
+
 
 async def async_setup_entry(
     hass: HomeAssistant,
     config_entry: ConfigEntry,
     async_add_entities,
 ):
-    config = hass.data[DOMAIN][config_entry.entry_id]
-    await async_setup_platform(hass, config, async_add_entities)
+    data = hass.data[DOMAIN][config_entry.entry_id]
+    coordinator = data["coordinator"]
+    await async_setup_client(
+        hass,
+        data["client"],
+        async_add_entities,
+        config_entry.entry_id,
+        get_entry_options(config_entry),
+        coordinator.schedules,
+    )
+
+    known = set()
+
+    @callback
+    def _async_add_new_zones() -> None:
+        """Add heating statistics sensors for zones that appeared since the last refresh."""
+        zones = coordinator.zones()
+        new = [zone_id for zone_id in zones if zone_id not in known]
+        known.update(new)
+        if new:
+            async_add_entities(
+                ComapHeatingSensor(coordinator, zone_id, kind)
+                for zone_id in new
+                for kind in HEATING_SENSORS
+            )
+
+    @callback
+    def _async_zone_removed(zone_id) -> None:
+        """Forget a zone whose device was removed, so it is added again if it returns."""
+        known.discard(zone_id)
+
+    _async_add_new_zones()
+    config_entry.async_on_unload(coordinator.async_add_listener(_async_add_new_zones))
+    config_entry.async_on_unload(
+        async_dispatcher_connect(
+            hass,
+            SIGNAL_ZONE_REMOVED.format(config_entry.entry_id),
+            _async_zone_removed,
+        )
+    )
 
 
 async def async_setup_platform(
     hass: HomeAssistant,
     config: ConfigType,
     async_add_entities: AddEntitiesCallback,
+    discovery_info=None,
 ) -> None:
     """Set up the comapsmarthome platform."""
 
-    client = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
-    housing = [ComapHousingSensor(client)]
-    async_add_entities(housing, update_before_add=True)
+    client, _ = await async_get_yaml_session(
+        hass, config[CONF_USERNAME], config[CONF_PASSWORD]
+    )
+    options = get_entry_options(None)
+    if CONF_SCAN_INTERVAL in config:
+        options[CONF_SENSOR_SCAN_INTERVAL] = cv.time_period(
+            config[CONF_SCAN_INTERVAL]
+        ).total_seconds()
+    await async_setup_client(hass, client, async_add_entities, None, options)
+    async_register_housing_services(hass)
 
-    async def set_away(call):
-        """Set home away."""
-        await client.leave_home()
 
-    async def set_home(call):
-        """Set home."""
-        await client.return_home()
+async def async_setup_client(
+    hass: HomeAssistant,
+    client: ComapClient,
+    async_add_entities: AddEntitiesCallback,
+    entry_id: str | None,
+    options: dict,
+    schedules: list | None = None,
+) -> None:
+    """Set up the housing sensor for a connected client.
 
-    hass.services.async_register(DOMAIN, SERVICE_SET_AWAY, set_away)
-    hass.services.async_register(DOMAIN, SERVICE_SET_HOME, set_home)
+    Without already fetched schedules the sensor is updated before being added.
+    """
+    housing = [
+        ComapHousingSensor(
+            client, entry_id, options[CONF_SENSOR_SCAN_INTERVAL], schedules
+        )
+    ]
+    async_add_entities(housing, update_before_add=schedules is None)
 
     return True
 
 
-class ComapHousingSensor(Entity):
-    def __init__(self, client):
-        super().__init__()
+class ComapHousingSensor(ComapPolledEntity):
+    _scan_interval_option = CONF_SENSOR_SCAN_INTERVAL
+
+    def __init__(self, client, entry_id=None, scan_interval=60, schedules=None):
+        super().__init__(entry_id, scan_interval)
         self.client = client
         self.housing = client.housing
-        self._name = client.get_housings()[0].get("name")
+        self._name = client.housing_info.get("name")
         self._state = None
         self._available = True
-        self.attrs: dict[str, Any] = {}
+        self.attrs: dict[str, Any] = {
+            ATTR_ADDRESS: client.housing_info.get("address")
+        }
+        if schedules is not None:
+            self.attrs[ATTR_AVL_SCHDL] = self.parse_schedules(schedules)
 
     @property
     def name(self) -> str:
@@ -116,7 +215,7 @@ class ComapHousingSensor(Entity):
         )
 
     async def async_update(self):
-        housings = await self.hass.async_add_executor_job(self.client.get_housings)
+        housings = await self.client.async_get_housings()
         self._name = housings[0].get("name")
         self.attrs[ATTR_ADDRESS] = housings[0].get("address")
         r = await self.get_schedules()
@@ -131,3 +230,64 @@ class ComapHousingSensor(Entity):
         for schedule in r:
             schedules.update({schedule["id"]: schedule["title"]})
         return schedules
+
+
+class ComapHeatingSensor(CoordinatorEntity[ComapCoordinator], RestoreSensor):
+    """Heating runtime statistic of a zone, kept by the coordinator."""
+
+    def __init__(self, coordinator: ComapCoordinator, zone_id, kind):
+        super().__init__(coordinator)
+        self.zone_id = zone_id
+        self.kind = kind
+        description = HEATING_SENSORS[kind]
+        self._zone_name = coordinator.data[zone_id]["title"]
+        self._attr_name = self._zone_name + " " + description["name"]
+        self._attr_unique_id = zone_id + "_" + kind
+        self._attr_device_class = description["device_class"]
+        self._attr_state_class = description["state_class"]
+        self._attr_native_unit_of_measurement = description["unit"]
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info."""
+        return DeviceInfo(
+            identifiers={
+                # Serial numbers are unique identifiers within a specific domain
+                (DOMAIN, self.zone_id)
+            },
+            name=self._zone_name,
+            manufacturer="comap",
+        )
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        # Carry totals over restarts so long-term statistics keep accumulating
+        last = await self.async_get_last_sensor_data()
+        stats = self.coordinator.heating_stats.get(self.zone_id)
+        if last is not None and last.native_value is not None and stats is not None:
+            if self.kind == "heating_time":
+                stats.on_time += float(last.native_value) * 3600
+            elif self.kind == "heating_transitions":
+                stats.transitions += int(last.native_value)
+        self._update_value()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        self._attr_available = self.zone_id in self.coordinator.data
+        self._update_value()
+        self.async_write_ha_state()
+
+    def _update_value(self) -> None:
+        stats = self.coordinator.heating_stats.get(self.zone_id)
+        if stats is None:
+            self._attr_native_value = None
+        elif self.kind == "heating_time":
+            self._attr_native_value = round(stats.on_time / 3600, 3)
+        elif self.kind == "heating_transitions":
+            self._attr_native_value = stats.transitions
+        else:
+            window = int(self.kind.rsplit("_", 1)[1])
+            self._attr_native_value = stats.duty_cycle(
+                window, dt_util.utcnow().timestamp()
+            )
@@ -0,0 +1,260 @@
+"""Integration wide services for ComapSmartHome."""
+from datetime import datetime
+import json
+import logging
+
+import httpx
+import voluptuous as vol
+
+from homeassistant.components import persistent_notification
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.helpers import config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    ATTR_CYCLES,
+    ATTR_HOUSING,
+    DATA_YAML_SESSIONS,
+    DOMAIN,
+    SERVICE_GET_SNAPSHOT,
+    SERVICE_PROFILE,
+    SERVICE_SET_AWAY,
+    SERVICE_SET_HOME,
+    SERVICE_START_TRACE,
+    SERVICE_STOP_TRACE,
+)
+from .comap import ComapClient
+from .profiling import async_profile, profile_report
+from .tracing import ComapReplayTransport
+
+_LOGGER = logging.getLogger(__name__)
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_CYCLES, default=3): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=20)
+        )
+    }
+)
+
+SNAPSHOT_SCHEMA = vol.Schema(
+    {vol.Optional(ATTR_HOUSING): vol.All(cv.ensure_list, [cv.string])}
+)
+
+
+# Also registered by the legacy YAML sensor platform
+HOUSING_SERVICES = [SERVICE_SET_AWAY, SERVICE_SET_HOME]
+
+SERVICES = [
+    *HOUSING_SERVICES,
+    SERVICE_START_TRACE,
+    SERVICE_STOP_TRACE,
+    SERVICE_PROFILE,
+    SERVICE_GET_SNAPSHOT,
+]
+
+
+def _journals(hass: HomeAssistant) -> list:
+    """Return the command journals of every entry and YAML account."""
+    journals = [data["journal"] for data in hass.data.get(DOMAIN, {}).values()]
+    for session in hass.data.get(DATA_YAML_SESSIONS, {}).values():
+        if session.done() and session.exception() is None:
+            journals.append(session.result()[1])
+    return journals
+
+
+@callback
+def async_register_housing_services(hass: HomeAssistant) -> None:
+    """Register the away and home services, acting on every housing."""
+
+    async def set_away(call: ServiceCall) -> None:
+        """Set every housing away."""
+        for journal in _journals(hass):
+            await journal.async_submit("leave_home")
+
+    async def set_home(call: ServiceCall) -> None:
+        """Set every housing back home."""
+        for journal in _journals(hass):
+            await journal.async_submit("return_home")
+
+    hass.services.async_register(DOMAIN, SERVICE_SET_AWAY, set_away)
+    hass.services.async_register(DOMAIN, SERVICE_SET_HOME, set_home)
+
+
+@callback
+def async_register_services(hass: HomeAssistant) -> None:
+    """Register the housing, snapshot, trace and profiling services."""
+    async_register_housing_services(hass)
+
+    async def get_snapshot(call: ServiceCall) -> ServiceResponse:
+        """Return the cached data of every housing, without calling the API."""
+        housings = call.data.get(ATTR_HOUSING)
+        now = dt_util.utcnow()
+        snapshot = {}
+        for data in hass.data[DOMAIN].values():
+            housing = data["client"].housing
+            if housings and housing not in housings:
+                continue
+            snapshot[housing] = _housing_snapshot(data["coordinator"], now)
+        return {"housings": snapshot}
+
+    async def start_trace(call: ServiceCall) -> None:
+        """Start recording API exchanges for every entry."""
+        for data in hass.data[DOMAIN].values():
+            data["client"].start_recording()
+
+    async def stop_trace(call: ServiceCall) -> None:
+        """Stop recording and write one trace file per entry to the config directory."""
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        for entry_id, data in hass.data[DOMAIN].items():
+            recorder = data["client"].stop_recording()
+            if recorder is None:
+                continue
+            path = hass.config.path(f"{DOMAIN}_trace_{entry_id}_{stamp}.jsonl")
+            await hass.async_add_executor_job(recorder.save, path)
+            _LOGGER.info("Wrote %s API exchanges to %s", len(recorder.exchanges), path)
+            if recorder.dropped:
+                _LOGGER.warning(
+                    "Trace for %s dropped its %s oldest exchanges", entry_id, recorder.dropped
+                )
+
+    async def profile(call: ServiceCall) -> None:
+        """Profile refresh and command cycles and write a report per entry."""
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        for entry_id, data in hass.data[DOMAIN].items():
+            replay = await _async_replay_client(data["client"])
+            # Cycles a few seconds apart would skew the statistics of the zones
+            coordinator = data["coordinator"].detached_copy()
+            try:
+                profiler, durations = await async_profile(
+                    call.data[ATTR_CYCLES],
+                    lambda coordinator=coordinator, replay=replay: _async_profile_cycle(
+                        coordinator, replay
+                    ),
+                )
+            finally:
+                await replay.async_close()
+            call_stats = data.get("call_stats")
+            sections = [
+                (
+                    "Client calls",
+                    call_stats.report()
+                    if call_stats is not None
+                    else "Enable debug logging for comapsmarthome to time client calls",
+                ),
+                (
+                    "Request latency",
+                    json.dumps(data["client"].latency.stats(), indent=2),
+                ),
+            ]
+            path = hass.config.path(f"{DOMAIN}_profile_{entry_id}_{stamp}")
+            await hass.async_add_executor_job(
+                _write_profile, path, profiler, durations, sections
+            )
+            persistent_notification.async_create(
+                hass,
+                f"Profile report written to {path}.txt, raw stats to {path}.prof",
+                title="ComapSmartHome profile",
+            )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_SNAPSHOT,
+        get_snapshot,
+        schema=SNAPSHOT_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(DOMAIN, SERVICE_START_TRACE, start_trace)
+    hass.services.async_register(DOMAIN, SERVICE_STOP_TRACE, stop_trace)
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, profile, schema=PROFILE_SCHEMA
+    )
+
+
+@callback
+def async_unregister_services(hass: HomeAssistant) -> None:
+    """Remove the services once the last entry is unloaded.
+
+    The away and home services stay while YAML accounts still use them.
+    """
+    for service in SERVICES:
+        if service in HOUSING_SERVICES and hass.data.get(DATA_YAML_SESSIONS):
+            continue
+        hass.services.async_remove(DOMAIN, service)
+
+
+def _housing_snapshot(coordinator, now) -> dict:
+    """Return the last refresh of a coordinator in a JSON friendly form."""
+    updated = coordinator.last_refreshed
+    schedules = {
+        schedule.get("id"): schedule.get("title")
+        for schedule in coordinator.schedules or []
+    }
+    zones = {}
+    for zone_id, zone in coordinator.zones().items():
+        stats = coordinator.heating_stats.get(zone_id)
+        zones[zone_id] = {
+            **zone,
+            "schedule_title": schedules.get(zone.get("schedule_id")),
+            "heating_time": None if stats is None else round(stats.on_time / 3600, 3),
+            **coordinator.trends.get(zone_id, {}),
+        }
+    return {
+        "updated": None if updated is None else updated.isoformat(),
+        "age": None if updated is None else round((now - updated).total_seconds(), 1),
+        "available": coordinator.last_update_success,
+        **coordinator.housing_state,
+        "temperatures": (coordinator.data or {}).get("temperatures"),
+        "schedules": schedules,
+        "zones": zones,
+    }
+
+
+async def _async_replay_client(client) -> ComapClient:
+    """Return a client for the same housing whose commands are answered locally.
+
+    Profiling goes through the whole command path without writing to the
+    real heating system.
+    """
+    url = str(
+        httpx.URL(
+            f"{ComapClient._BASEURL}thermal/housings/{client.housing}"
+            "/thermal-control/heating-system-state"
+        )
+    )
+    exchanges = [
+        {
+            "method": "POST",
+            "url": str(httpx.URL(ComapClient._AUTHURL)),
+            "status": 200,
+            "elapsed": 0,
+            "response": {
+                "AuthenticationResult": {"AccessToken": "replay", "ExpiresIn": 3600}
+            },
+        },
+        {"method": "PUT", "url": url, "status": 200, "elapsed": 0, "response": None},
+    ]
+    replay = ComapClient(
+        username="", password="", transport=ComapReplayTransport(exchanges, speed=0)
+    )
+    await replay.async_login()
+    replay.housing = client.housing
+    return replay
+
+
+async def _async_profile_cycle(coordinator, replay) -> None:
+    """Run one coordinator refresh and one replayed command round trip."""
+    await coordinator.async_refresh()
+    await replay.turn_on()
+
+
+def _write_profile(path, profiler, durations, sections) -> None:
+    profiler.dump_stats(path + ".prof")
+    with open(path + ".txt", "w", encoding="utf-8") as file:
+        file.write(profile_report(profiler, durations, sections))
@@ -1,37 +1,35 @@
-from datetime import timedelta
 import logging
 from typing import Any
 
 from homeassistant.components.switch import SwitchDeviceClass, SwitchEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from . import ComapClient, ComapCoordinator
+from . import ComapCoordinator
 from .const import DOMAIN
 
-SCAN_INTERVAL = timedelta(minutes=5)
-
 
 async def async_setup_entry(
     hass: HomeAssistant,
     config_entry: ConfigEntry,
     async_add_entities,
 ) -> None:
-    config = hass.data[DOMAIN][config_entry.entry_id]
-    client = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
-    async_add_entities([ComapHousingSensor(client)], update_before_add=True)
+    data = hass.data[DOMAIN][config_entry.entry_id]
+    async_add_entities([ComapHousingSensor(data["coordinator"], data["journal"])])
+
 
+class ComapHousingSensor(CoordinatorEntity[ComapCoordinator], SwitchEntity):
+    """Heating system switch, its state read from the zone coordinator."""
 
-class ComapHousingSensor(SwitchEntity):
-    def __init__(self, client) -> None:
-        super().__init__()
-        self.client = client
-        self.housing = client.housing
-        housing = client.get_housings()[0]
-        self._name = housing.get("name")
-        self._is_on = None
+    def __init__(self, coordinator: ComapCoordinator, journal) -> None:
+        super().__init__(coordinator)
+        self.client = coordinator.client
+        self.journal = journal
+        self.housing = self.client.housing
+        self._name = self.client.housing_info.get("name")
+        self._update_state()
         self._attr_device_class = SwitchDeviceClass.SWITCH
 
     @property
@@ -61,12 +59,18 @@ class ComapHousingSensor(SwitchEntity):
         """If the sensor is currently on or off."""
         return self._is_on
 
-    async def async_update(self):
-        zones = await self.client.get_zones()
-        self._is_on = zones["heating_system_state"] == "on"
+    def _update_state(self) -> None:
+        state = self.coordinator.housing_state.get("heating_system_state")
+        self._is_on = None if state is None else state == "on"
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        self._update_state()
+        self.async_write_ha_state()
 
     async def async_turn_on(self, **kwargs: Any) -> None:
-        return await self.client.turn_on()
+        await self.journal.async_submit("turn_on")
 
     async def async_turn_off(self, **kwargs: Any) -> None:
-        return await self.client.turn_off()
+        await self.journal.async_submit("turn_off")
@@ -0,0 +1,142 @@
+"""Record and replay ComapSmartHome API traffic.
+
+A trace is a JSON lines file, one exchange per line, with credentials and
+tokens redacted. Recording wraps the client transport; replaying swaps it for
+``ComapReplayTransport`` so the client runs against the trace with no network.
+"""
+import asyncio
+from collections import defaultdict, deque
+import json
+import time
+
+import httpx
+
+REDACTED = "**REDACTED**"
+REDACTED_KEYS = {
+    "USERNAME",
+    "PASSWORD",
+    "REFRESH_TOKEN",
+    "AccessToken",
+    "RefreshToken",
+    "IdToken",
+    "address",
+}
+REDACTED_HEADERS = {"authorization", "cookie", "set-cookie"}
+# Most recent exchanges kept by a recording, older ones are dropped
+MAX_TRACE_EXCHANGES = 500
+
+
+def redact(data):
+    """Return a copy of decoded JSON with sensitive values replaced."""
+    if isinstance(data, dict):
+        return {
+            key: REDACTED if key in REDACTED_KEYS else redact(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [redact(value) for value in data]
+    return data
+
+
+def _decode(content):
+    if not content:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content.decode(errors="replace")
+
+
+class ComapTraceRecorder:
+    """Collect redacted request/response exchanges with timing.
+
+    Exchanges are kept serialized, and only the latest ``max_exchanges``,
+    so a recording left running stays bounded.
+    """
+
+    def __init__(self, max_exchanges=MAX_TRACE_EXCHANGES):
+        self.started = time.monotonic()
+        self.exchanges = deque(maxlen=max_exchanges)
+        self.dropped = 0
+
+    def record(self, request, response, started, elapsed):
+        if len(self.exchanges) == self.exchanges.maxlen:
+            self.dropped += 1
+        exchange = {
+            "offset": round(started - self.started, 6),
+            "elapsed": round(elapsed, 6),
+            "method": request.method,
+            "url": str(request.url.copy_with(query=None)),
+            "params": dict(request.url.params),
+            "headers": {
+                key: REDACTED if key.lower() in REDACTED_HEADERS else value
+                for key, value in request.headers.items()
+            },
+            "request": redact(_decode(request.content)),
+            "status": response.status_code,
+            "response": redact(_decode(response.content)),
+        }
+        self.exchanges.append(json.dumps(exchange))
+
+    def save(self, path):
+        """Write the trace to a file. Blocking, run it in an executor."""
+        with open(path, "w", encoding="utf-8") as file:
+            for line in list(self.exchanges):
+                file.write(line + "\n")
+
+
+def load_trace(path):
+    """Read a trace file. Blocking, run it in an executor."""
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class ComapRecordingTransport(httpx.AsyncBaseTransport):
+    """Transport passing requests through while feeding a recorder."""
+
+    def __init__(self, transport, recorder):
+        self._transport = transport
+        self.recorder = recorder
+
+    async def handle_async_request(self, request):
+        started = time.monotonic()
+        response = await self._transport.handle_async_request(request)
+        await response.aread()
+        self.recorder.record(request, response, started, time.monotonic() - started)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ComapReplayTransport(httpx.AsyncBaseTransport):
+    """Transport answering from a recorded trace.
+
+    Requests are matched on method and URL, in recorded order. Once the
+    recorded answers for a request are used up, the last one is repeated so
+    a short trace can drive a long benchmark. ``speed`` scales recorded
+    latency: 1 replays in real time, 10 ten times faster, 0 without waiting.
+    """
+
+    def __init__(self, exchanges, speed=1.0):
+        self.speed = speed
+        self._queues = defaultdict(deque)
+        self._last = {}
+        for exchange in exchanges:
+            self._queues[(exchange["method"], exchange["url"])].append(exchange)
+
+    async def handle_async_request(self, request):
+        key = (request.method, str(request.url.copy_with(query=None)))
+        queue = self._queues.get(key)
+        if queue:
+            exchange = self._last[key] = queue.popleft()
+        elif key in self._last:
+            exchange = self._last[key]
+        else:
+            return httpx.Response(404, json={"message": "Not in trace"})
+
+        if self.speed:
+            await asyncio.sleep(exchange["elapsed"] / self.speed)
+        if exchange["response"] is None:
+            return httpx.Response(exchange["status"])
+        return httpx.Response(exchange["status"], json=exchange["response"])
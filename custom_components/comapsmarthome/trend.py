@@ -0,0 +1,160 @@
+"""Per-zone temperature history and batched heating and cooling rate estimation."""
+import numpy as np
+
+HISTORY_SIZE = 48
+# Fewest samples needed to fit the trend
+MIN_SAMPLES = 4
+# Fewest consecutive sample pairs needed for a heating or cooling rate
+MIN_PAIRS = 3
+
+
+def resolve_set_point(zone, temperatures):
+    """Return the numeric set point of a thermostat zone, or None."""
+    instruction = (zone.get("set_point") or {}).get("instruction")
+    if isinstance(instruction, (int, float)):
+        return float(instruction)
+    temperatures = temperatures or {}
+    for table in (
+        temperatures,
+        temperatures.get("connected"),
+        temperatures.get("smart"),
+    ):
+        value = table.get(instruction) if isinstance(table, dict) else None
+        if isinstance(value, (int, float)):
+            return float(value)
+    return None
+
+
+def _slopes(hours, temps, mask):
+    """Least squares slope of temps over hours for every row, on masked samples."""
+    count = mask.sum(axis=1)
+    weights = np.where(mask, 1.0, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_t = (hours * weights).sum(axis=1) / count
+        mean_y = (np.nan_to_num(temps) * weights).sum(axis=1) / count
+        dt = (hours - mean_t[:, None]) * weights
+        dy = np.nan_to_num(temps) - mean_y[:, None]
+        slopes = (dt * dy).sum(axis=1) / (dt * dt).sum(axis=1)
+    slopes[count < MIN_SAMPLES] = np.nan
+    return slopes
+
+
+def _run_rates(hours, temps, mask, max_gap=np.inf):
+    """Temperature change per hour within runs of consecutive masked samples, per row.
+
+    Only pairs of neighbouring samples both in ``mask`` and at most ``max_gap``
+    hours apart count, so the rate is measured inside each heating or cooling
+    episode and the offsets between episodes do not weigh in.
+    """
+    elapsed = hours[:, 1:] - hours[:, :-1]
+    pairs = mask[:, 1:] & mask[:, :-1] & (elapsed > 0) & (elapsed <= max_gap)
+    dt = np.where(pairs, elapsed, 0.0)
+    dy = np.where(pairs, np.nan_to_num(temps[:, 1:] - temps[:, :-1]), 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = dy.sum(axis=1) / dt.sum(axis=1)
+    rates[pairs.sum(axis=1) < MIN_PAIRS] = np.nan
+    return rates
+
+
+class ComapTemperatureHistory:
+    """Fixed-size ring buffers of zone samples, one row per zone in shared arrays."""
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self._rows: dict[str, int] = {}
+        self._times = np.full((0, size), np.nan)
+        self._temps = np.full((0, size), np.nan)
+        self._set_points = np.full((0, size), np.nan)
+        self._heating = np.zeros((0, size), dtype=bool)
+        self._cursor = 0
+
+    def _grow(self, zone_ids):
+        new = [zone_id for zone_id in zone_ids if zone_id not in self._rows]
+        if not new:
+            return
+        for zone_id in new:
+            self._rows[zone_id] = len(self._rows)
+        extra = (len(new), self.size)
+        self._times = np.vstack([self._times, np.full(extra, np.nan)])
+        self._temps = np.vstack([self._temps, np.full(extra, np.nan)])
+        self._set_points = np.vstack([self._set_points, np.full(extra, np.nan)])
+        self._heating = np.vstack([self._heating, np.zeros(extra, dtype=bool)])
+
+    def remove(self, zone_id):
+        """Forget a zone, compacting the arrays to the zones still tracked."""
+        row = self._rows.pop(zone_id, None)
+        if row is None:
+            return
+        for other, index in self._rows.items():
+            if index > row:
+                self._rows[other] = index - 1
+        self._times = np.delete(self._times, row, axis=0)
+        self._temps = np.delete(self._temps, row, axis=0)
+        self._set_points = np.delete(self._set_points, row, axis=0)
+        self._heating = np.delete(self._heating, row, axis=0)
+
+    def add(self, now, samples):
+        """Record one refresh worth of samples.
+
+        ``samples`` maps zone id to ``(temperature, set_point, heating)``;
+        zones missing from it get an empty slot.
+        """
+        self._grow(samples)
+        column = self._cursor
+        self._cursor = (self._cursor + 1) % self.size
+        self._times[:, column] = np.nan
+        self._temps[:, column] = np.nan
+        self._set_points[:, column] = np.nan
+        self._heating[:, column] = False
+        if not samples:
+            return
+        rows = [self._rows[zone_id] for zone_id in samples]
+        temps, set_points, heating = zip(*samples.values())
+        self._times[rows, column] = now
+        self._temps[rows, column] = np.array(temps, dtype=float)
+        self._set_points[rows, column] = np.array(set_points, dtype=float)
+        self._heating[rows, column] = heating
+
+    def estimate(self, now, max_gap=None):
+        """Return trend, heating and cooling rates in °C/h and minutes to set point per zone.
+
+        Heating and cooling rates skip sample pairs more than ``max_gap``
+        seconds apart, as the status between them is unknown.
+        """
+        if not self._rows:
+            return {}
+        hours = np.nan_to_num((self._times - now) / 3600)
+        valid = ~np.isnan(self._times) & ~np.isnan(self._temps)
+        trend = _slopes(hours, self._temps, valid)
+
+        # Oldest sample first, so neighbouring columns are consecutive refreshes
+        order = (np.arange(self.size) + self._cursor) % self.size
+        hours, temps = hours[:, order], self._temps[:, order]
+        valid, on = valid[:, order], self._heating[:, order]
+        max_gap = np.inf if max_gap is None else max_gap / 3600
+        heating = _run_rates(hours, temps, valid & on, max_gap)
+        cooling = _run_rates(hours, temps, valid & ~on, max_gap)
+
+        latest = (self._cursor - 1) % self.size
+        temps = self._temps[:, latest]
+        set_points = self._set_points[:, latest]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            to_target = np.where(
+                (set_points > temps) & (heating > 0),
+                (set_points - temps) / heating * 60,
+                np.nan,
+            )
+
+        def value(array, row, digits):
+            item = array[row]
+            return None if np.isnan(item) else round(float(item), digits)
+
+        return {
+            zone_id: {
+                "temperature_trend": value(trend, row, 2),
+                "heating_rate": value(heating, row, 2),
+                "cooling_rate": value(cooling, row, 2),
+                "minutes_to_set_point": value(to_target, row, 0),
+            }
+            for zone_id, row in self._rows.items()
+        }
@@ -0,0 +1,107 @@
+"""Fixtures for ComapSmartHome tests."""
+from collections import Counter
+from copy import deepcopy
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from custom_components.comapsmarthome.comap import ComapClient
+
+HOUSING = "housing1"
+
+ZONES = [
+    {
+        "id": "zone1",
+        "title": "Living room",
+        "temperature": 19.5,
+        "humidity": 45,
+        "heating_status": "heating",
+        "set_point_type": "defined_temperature",
+        "set_point": {"instruction": "comfort"},
+        "last_presence_detected": "2024-01-01T10:00:00+00:00",
+    },
+]
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Load the integration from custom_components."""
+    yield
+
+
+class MockComapApi:
+    """Answer the Comap and Cognito endpoints, counting requests by path."""
+
+    def __init__(self):
+        self.requests = Counter()
+        # Zones answered by thermal-details, tests may edit them
+        self.zones = deepcopy(ZONES)
+        self.transport = httpx.MockTransport(self.handler)
+
+    def handler(self, request):
+        self.requests[request.url.path] += 1
+        path = request.url.path
+        if request.url.host.startswith("cognito"):
+            return httpx.Response(
+                200,
+                json={
+                    "AuthenticationResult": {
+                        "AccessToken": "access",
+                        "RefreshToken": "refresh",
+                        "ExpiresIn": 3600,
+                    }
+                },
+            )
+        if path.endswith("/park/housings"):
+            return httpx.Response(200, json=[{"id": HOUSING, "name": "Home"}])
+        if path.endswith("/thermal-details"):
+            return httpx.Response(
+                200, json={"heating_system_state": "on", "zones": self.zones}
+            )
+        if path.endswith("/programs"):
+            return httpx.Response(
+                200,
+                json={
+                    "programs": [
+                        {
+                            "id": "program1",
+                            "is_activated": True,
+                            "zones": [{"id": "zone1", "schedule_id": "schedule1"}],
+                        }
+                    ]
+                },
+            )
+        if path.endswith("/custom-temperatures"):
+            return httpx.Response(
+                200, json={"connected": {"comfort": 20}, "smart": {}}
+            )
+        if path.endswith("/schedules"):
+            return httpx.Response(
+                200, json=[{"id": "schedule1", "title": "Week", "day_timeslots": []}]
+            )
+        if "/thermal-control/" in path and request.method != "GET":
+            return httpx.Response(200)
+        return httpx.Response(404)
+
+    @property
+    def total(self):
+        return sum(self.requests.values())
+
+    def count(self, endpoint):
+        """Return the number of requests to paths ending with ``endpoint``."""
+        return sum(
+            count for path, count in self.requests.items() if path.endswith(endpoint)
+        )
+
+
+@pytest.fixture
+def mock_api():
+    """Route every client created by the integration to a mocked API."""
+    api = MockComapApi()
+
+    def client(**kwargs):
+        return ComapClient(transport=api.transport, **kwargs)
+
+    with patch("custom_components.comapsmarthome.ComapClient", side_effect=client):
+        yield api
@@ -0,0 +1,98 @@
+"""Test the Comap API client."""
+import asyncio
+
+import httpx
+import pytest
+
+from custom_components.comapsmarthome.comap import ComapClient
+
+URL = ComapClient._BASEURL + "thermal/housings/housing1/thermal-details"
+FAST = 0.01
+
+
+class SlowApi:
+    """Answer thermal-details after the delays queued in ``delays``."""
+
+    def __init__(self, *delays, error=None):
+        self.delays = list(delays)
+        self.error = error
+        self.requests = 0
+
+    async def handler(self, request):
+        if request.url.host.startswith("cognito"):
+            return httpx.Response(
+                200,
+                json={"AuthenticationResult": {"AccessToken": "a", "ExpiresIn": 3600}},
+            )
+        self.requests += 1
+        await asyncio.sleep(self.delays.pop(0))
+        if self.error is not None:
+            raise self.error("failed", request=request)
+        return httpx.Response(200, json={"attempt": self.requests})
+
+
+async def _async_client(api, hedge_percentile=90) -> ComapClient:
+    client = ComapClient(
+        username="user@example.com",
+        password="secret",
+        transport=httpx.MockTransport(api.handler),
+        hedge_percentile=hedge_percentile,
+    )
+    await client.async_login()
+    # Learned latency, enough samples to hedge
+    for _ in range(client.latency.min_samples):
+        client.latency.record("thermal-details", FAST)
+    return client
+
+
+async def test_slow_read_is_hedged() -> None:
+    """A read outlasting the latency percentile is duplicated, the first answer wins."""
+    api = SlowApi(1, 0)
+    client = await _async_client(api)
+
+    assert await client.async_get(URL) == {"attempt": 2}
+    await asyncio.sleep(0)
+    await client.async_close()
+
+    assert api.requests == 2
+    samples = sorted(client.latency._samples["thermal-details"])
+    # The hedge answer, and the overtaken attempt counted as the time waited
+    assert len(samples) == client.latency.min_samples + 2
+    assert samples[-1] >= FAST
+
+
+async def test_fast_read_is_not_hedged() -> None:
+    """A read answered within the latency percentile is sent once."""
+    api = SlowApi(0)
+    client = await _async_client(api)
+
+    assert await client.async_get(URL) == {"attempt": 1}
+    await client.async_close()
+
+    assert api.requests == 1
+
+
+async def test_timeouts_are_recorded() -> None:
+    """A timed out read counts as at least the time waited."""
+    api = SlowApi(0.05, 0.05, error=httpx.ReadTimeout)
+    client = await _async_client(api, hedge_percentile=0)
+
+    with pytest.raises(httpx.ReadTimeout):
+        await client.async_get(URL)
+    await client.async_close()
+
+    samples = client.latency._samples["thermal-details"]
+    assert len(samples) == client.latency.min_samples + 1
+    assert samples[-1] >= 0.05
+
+
+async def test_connection_errors_are_not_recorded() -> None:
+    """A read failing right away says nothing about latency."""
+    api = SlowApi(0, error=httpx.ConnectError)
+    client = await _async_client(api, hedge_percentile=0)
+
+    with pytest.raises(httpx.ConnectError):
+        await client.async_get(URL)
+    await client.async_close()
+
+    assert len(client.latency._samples["thermal-details"]) == client.latency.min_samples
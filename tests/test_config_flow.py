@@ -0,0 +1,54 @@
+"""Test the ComapSmartHome options flow."""
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from homeassistant.const import (
+    CONF_PASSWORD,
+    CONF_SCAN_INTERVAL,
+    CONF_USERNAME,
+)
+from homeassistant.core import HomeAssistant
+from homeassistant.data_entry_flow import FlowResultType
+
+from custom_components.comapsmarthome import get_entry_options
+from custom_components.comapsmarthome.const import CONF_PRESENCE_WINDOW, DOMAIN
+
+
+async def test_options_apply_without_reload(hass: HomeAssistant, mock_api) -> None:
+    """Changed options reach the running coordinator and entities."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_USERNAME: "user@example.com", CONF_PASSWORD: "secret"},
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    data = hass.data[DOMAIN][entry.entry_id]
+    logins = mock_api.count("/")
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] == FlowResultType.FORM
+    assert result["step_id"] == "init"
+
+    options = {
+        **get_entry_options(entry),
+        CONF_SCAN_INTERVAL: 120,
+        CONF_PRESENCE_WINDOW: 600,
+    }
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], user_input=options
+    )
+    await hass.async_block_till_done()
+
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    assert entry.options[CONF_SCAN_INTERVAL] == 120
+    # Same client and coordinator, no login or fetch from a reload
+    assert hass.data[DOMAIN][entry.entry_id] is data
+    assert mock_api.count("/") == logins
+    assert data["coordinator"].scan_interval.total_seconds() == 120
+    presence = hass.data["entity_components"]["binary_sensor"].get_entity(
+        "binary_sensor.living_room_presence"
+    )
+    assert presence.presence_window.total_seconds() == 600
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
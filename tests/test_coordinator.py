@@ -0,0 +1,58 @@
+"""Test the ComapSmartHome zone coordinator."""
+from datetime import timedelta
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from custom_components.comapsmarthome import ComapCoordinator
+from custom_components.comapsmarthome.comap import ComapClient
+
+POLL = timedelta(seconds=30)
+
+
+async def _async_coordinator(hass: HomeAssistant, mock_api) -> ComapCoordinator:
+    client = ComapClient(
+        username="user@example.com", password="secret", transport=mock_api.transport
+    )
+    await client.async_connect()
+    coordinator = ComapCoordinator(hass, client)
+    coordinator.schedule_aware = True
+    return coordinator
+
+
+async def test_programs_follow_schedule_transitions(
+    hass: HomeAssistant, mock_api, freezer
+) -> None:
+    """Zones are polled every time, programs after transitions and at the baseline."""
+    mock_api.zones[0]["next_timeslot"] = {
+        "begin_at": (dt_util.now() + timedelta(minutes=2)).isoformat()
+    }
+    coordinator = await _async_coordinator(hass, mock_api)
+
+    await coordinator.async_refresh()
+    for _ in range(20):
+        freezer.tick(POLL)
+        await coordinator.async_refresh()
+    await coordinator.client.async_close()
+
+    assert mock_api.count("/thermal-details") == 21
+    # Once at start, once just after the transition at 2 min, once 5 min later
+    assert mock_api.count("/programs") == 3
+    assert mock_api.count("/custom-temperatures") == 3
+    assert mock_api.count("/schedules") == 1
+    assert coordinator.data["zone1"]["schedule_id"] == "schedule1"
+    assert coordinator.data["temperatures"] == {"connected": {"comfort": 20}, "smart": {}}
+
+
+async def test_expire_programs(hass: HomeAssistant, mock_api) -> None:
+    """A schedule change makes the next refresh fetch the programs again."""
+    coordinator = await _async_coordinator(hass, mock_api)
+    await coordinator.async_refresh()
+    await coordinator.async_refresh()
+    assert mock_api.count("/programs") == 1
+
+    coordinator.expire_programs()
+    await coordinator.async_refresh()
+    await coordinator.client.async_close()
+
+    assert mock_api.count("/programs") == 2
@@ -0,0 +1,205 @@
+"""Test setting up, reloading and unloading ComapSmartHome entries."""
+from datetime import timedelta
+import gc
+import weakref
+
+import pytest
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+from homeassistant.setup import async_setup_component
+from homeassistant.util import dt as dt_util
+
+from custom_components.comapsmarthome.const import (
+    DOMAIN,
+    SERVICE_GET_SNAPSHOT,
+    SERVICE_SET_AWAY,
+)
+
+RELOADS = 5
+
+
+def _entry(hass: HomeAssistant) -> MockConfigEntry:
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_USERNAME: "user@example.com", CONF_PASSWORD: "secret"},
+    )
+    entry.add_to_hass(hass)
+    return entry
+
+
+async def _async_poll(hass: HomeAssistant, minutes: int) -> None:
+    """Advance time minute by minute so every poller fires."""
+    for _ in range(minutes):
+        async_fire_time_changed(hass, dt_util.utcnow() + timedelta(minutes=1))
+        await hass.async_block_till_done()
+
+
+async def test_setup_and_unload(hass: HomeAssistant, mock_api) -> None:
+    """Setting up creates the entities, unloading releases everything."""
+    entry = _entry(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert entry.state is ConfigEntryState.LOADED
+    assert hass.states.get("climate.living_room") is not None
+    assert hass.services.has_service(DOMAIN, SERVICE_GET_SNAPSHOT)
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert entry.state is ConfigEntryState.NOT_LOADED
+    assert DOMAIN not in hass.data
+    assert not hass.services.has_service(DOMAIN, SERVICE_GET_SNAPSHOT)
+
+    # Nothing polls the API once unloaded
+    requests = mock_api.total
+    await _async_poll(hass, 10)
+    assert mock_api.total == requests
+
+
+async def test_reloads_keep_requests_and_memory_flat(
+    hass: HomeAssistant, mock_api
+) -> None:
+    """Every reload costs the same requests and leaves no client behind."""
+    entry = _entry(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    clients = []
+    per_reload = []
+    for _ in range(RELOADS):
+        clients.append(weakref.ref(hass.data[DOMAIN][entry.entry_id]["client"]))
+        requests = mock_api.total
+        assert await hass.config_entries.async_reload(entry.entry_id)
+        await hass.async_block_till_done()
+        per_reload.append(mock_api.total - requests)
+
+    assert len(set(per_reload)) == 1
+
+    # Polling after the reloads only runs the pollers of the loaded entry
+    requests = mock_api.total
+    await _async_poll(hass, 10)
+    after_reloads = mock_api.total - requests
+
+    assert await hass.config_entries.async_reload(entry.entry_id)
+    await hass.async_block_till_done()
+    requests = mock_api.total
+    await _async_poll(hass, 10)
+    assert mock_api.total - requests == after_reloads
+
+    gc.collect()
+    assert all(client() is None for client in clients)
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def test_remove_deletes_journal(
+    hass: HomeAssistant, mock_api, hass_storage
+) -> None:
+    """Removing an entry deletes its stored command journal."""
+    entry = _entry(hass)
+    key = f"{DOMAIN}.{entry.entry_id}.journal"
+    hass_storage[key] = {"version": 1, "key": key, "data": []}
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert await hass.config_entries.async_remove(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert key not in hass_storage
+
+
+async def test_removed_zone_statistics_are_dropped(
+    hass: HomeAssistant, mock_api, freezer
+) -> None:
+    """Once a zone is removed its statistics and history are dropped."""
+    mock_api.zones.append({**mock_api.zones[0], "id": "zone2", "title": "Bedroom"})
+    entry = _entry(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+    assert set(coordinator.trends) == {"zone1", "zone2"}
+
+    del mock_api.zones[1]
+    for _ in range(3):
+        await coordinator.async_refresh()
+
+    assert set(coordinator.heating_stats) == {"zone1"}
+    assert set(coordinator.trends) == {"zone1"}
+    assert coordinator.temperature_history._times.shape[0] == 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def test_platforms_share_one_zone_poll(
+    hass: HomeAssistant, mock_api, freezer
+) -> None:
+    """Every platform reads the zones of one 30 s poll, programs are fetched rarely."""
+    entry = _entry(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    start = {
+        endpoint: mock_api.count(endpoint)
+        for endpoint in ("/thermal-details", "/programs", "/custom-temperatures")
+    }
+
+    mock_api.zones[0]["temperature"] = 21.0
+    mock_api.zones[0]["heating_status"] = "cooling"
+    # Ten minutes
+    for _ in range(120):
+        freezer.tick(timedelta(seconds=5))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+    # About one zone poll per 30 s, stretched by jitter
+    assert 15 <= mock_api.count("/thermal-details") - start["/thermal-details"] <= 20
+    assert mock_api.count("/programs") - start["/programs"] <= 2
+    assert (
+        mock_api.count("/custom-temperatures") - start["/custom-temperatures"] <= 2
+    )
+    assert hass.states.get("climate.living_room").attributes[
+        "current_temperature"
+    ] == 21.0
+    assert hass.states.get("switch.home").state == "on"
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+
+# YAML platforms are never unloaded, their entities keep polling
+@pytest.mark.parametrize("expected_lingering_timers", [True])
+async def test_unload_keeps_yaml_housing_services(
+    hass: HomeAssistant, mock_api
+) -> None:
+    """Unloading the last entry leaves the away service of YAML accounts."""
+    assert await async_setup_component(
+        hass,
+        "sensor",
+        {
+            "sensor": {
+                "platform": DOMAIN,
+                CONF_USERNAME: "yaml@example.com",
+                CONF_PASSWORD: "secret",
+            }
+        },
+    )
+    await hass.async_block_till_done()
+    entry = _entry(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert hass.services.has_service(DOMAIN, SERVICE_SET_AWAY)
+    assert not hass.services.has_service(DOMAIN, SERVICE_GET_SNAPSHOT)
+    await hass.services.async_call(DOMAIN, SERVICE_SET_AWAY, blocking=True)
+    assert any(path.endswith("/leave-home") for path in mock_api.requests)
@@ -0,0 +1,146 @@
+"""Test the command journal."""
+import asyncio
+
+import httpx
+import pytest
+from pytest_homeassistant_custom_component.common import async_capture_events
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.comapsmarthome.const import EVENT_COMMAND_RESULT
+from custom_components.comapsmarthome.journal import ComapCommandJournal
+
+KEY = "comapsmarthome.test.journal"
+
+
+class FakeClient:
+    """Record commands, failing them while the cloud is down."""
+
+    housing = "housing1"
+
+    def __init__(self):
+        self.down = False
+        self.sent = []
+        # When set, commands wait for it before being answered
+        self.gate = None
+
+    async def _send(self, command, **kwargs):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.down:
+            raise httpx.ConnectError("unreachable")
+        self.sent.append((command, kwargs))
+
+    async def set_temporary_instruction(self, **kwargs):
+        await self._send("set_temporary_instruction", **kwargs)
+
+    async def set_schedule(self, **kwargs):
+        await self._send("set_schedule", **kwargs)
+
+    async def leave_home(self, **kwargs):
+        await self._send("leave_home", **kwargs)
+
+
+@pytest.fixture
+async def journal(hass: HomeAssistant):
+    client = FakeClient()
+    journal = ComapCommandJournal(hass, client, KEY)
+    await journal.async_load()
+    yield journal
+    await journal.async_shutdown()
+
+
+async def test_commands_are_coalesced(journal, hass_storage) -> None:
+    """While the cloud is down the latest command per zone and group is kept."""
+    journal.client.down = True
+
+    assert not await journal.async_submit(
+        "set_temporary_instruction", zone="zone1", instruction=19, active=True
+    )
+    assert not await journal.async_submit(
+        "set_temporary_instruction", zone="zone1", instruction=21, active=True
+    )
+    assert not await journal.async_submit("set_schedule", zone="zone1", schedule_id="s")
+    assert not await journal.async_submit("leave_home")
+
+    pending = [(entry["command"], entry["kwargs"]) for entry in journal.pending]
+    assert pending == [
+        (
+            "set_temporary_instruction",
+            {"zone": "zone1", "instruction": 21, "housing": "housing1"},
+        ),
+        ("set_schedule", {"zone": "zone1", "schedule_id": "s", "housing": "housing1"}),
+        ("leave_home", {"housing": "housing1"}),
+    ]
+    assert len(hass_storage[KEY]["data"]) == 3
+    # The first command failed, the others were queued without being tried
+    assert journal.client.sent == []
+
+
+async def test_replay_sends_in_order(
+    hass: HomeAssistant, journal, hass_storage
+) -> None:
+    """Journaled commands are replayed in order once the cloud is back."""
+    events = async_capture_events(hass, EVENT_COMMAND_RESULT)
+    journal.client.down = True
+    await journal.async_submit(
+        "set_temporary_instruction", zone="zone1", instruction=21
+    )
+    await journal.async_submit("leave_home")
+
+    journal.client.down = False
+    await journal.async_replay()
+    await hass.async_block_till_done()
+
+    assert [command for command, _ in journal.client.sent] == [
+        "set_temporary_instruction",
+        "leave_home",
+    ]
+    assert journal.pending == []
+    assert hass_storage[KEY]["data"] == []
+    assert [event.data["success"] for event in events] == [True, True]
+    # Sent straight away again once the journal is empty
+    assert await journal.async_submit("leave_home")
+
+
+async def test_superseded_command_is_kept(journal) -> None:
+    """A command submitted during its replay replaces the replayed one."""
+    journal.client.down = True
+    await journal.async_submit(
+        "set_temporary_instruction", zone="zone1", instruction=19
+    )
+    journal.client.down = False
+    journal.client.gate = asyncio.Event()
+
+    replay = asyncio.create_task(journal.async_replay())
+    await asyncio.sleep(0)
+    # Journaled behind the replay, superseding the command being sent
+    assert not await journal.async_submit(
+        "set_temporary_instruction", zone="zone1", instruction=22
+    )
+    journal.client.gate.set()
+    await replay
+
+    assert [entry["kwargs"]["instruction"] for entry in journal.pending] == [22]
+
+
+async def test_shutdown_stops_replay(hass: HomeAssistant, journal) -> None:
+    """Shutting down cancels a running replay and schedules no retry."""
+    journal.client.down = True
+    await journal.async_submit("leave_home")
+    journal.client.down = False
+    journal.client.gate = asyncio.Event()
+    journal._unsub_retry()
+    journal._unsub_retry = None
+
+    retry = hass.async_create_task(journal._async_retry())
+    await asyncio.sleep(0)
+    assert journal._replaying is retry
+
+    await journal.async_shutdown()
+
+    assert retry.cancelled()
+    assert journal._unsub_retry is None
+    assert journal.client.sent == []
+    # The interrupted command is replayed after the next start
+    assert [entry["command"] for entry in journal.pending] == ["leave_home"]
@@ -0,0 +1,101 @@
+"""Test the debug instrumentation."""
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+
+from custom_components.comapsmarthome.const import DOMAIN
+from custom_components.comapsmarthome.profiling import (
+    BLOCKING_THRESHOLD,
+    ComapCallStats,
+    instrument_client,
+)
+
+
+class FakeClient:
+    async def busy(self):
+        await asyncio.sleep(0)
+        # CPU work on the loop, such as decoding a large response
+        time.sleep(BLOCKING_THRESHOLD * 1.5)
+        await asyncio.sleep(0)
+        return "done"
+
+    async def idle(self):
+        await asyncio.sleep(BLOCKING_THRESHOLD * 1.5)
+        return "done"
+
+    async def failing(self):
+        await asyncio.sleep(0)
+        raise ValueError("failed")
+
+    def configure(self):
+        time.sleep(BLOCKING_THRESHOLD * 1.5)
+
+
+@pytest.fixture
+def client():
+    client = FakeClient()
+    stats = ComapCallStats(threading.get_ident())
+    instrument_client(client, stats)
+    client.stats = stats
+    return client
+
+
+async def test_loop_time_of_coroutines(client) -> None:
+    """Work between awaits counts as loop time, waiting does not."""
+    assert await client.busy() == "done"
+    assert await client.idle() == "done"
+
+    busy = client.stats.calls["ComapClient.busy"]
+    idle = client.stats.calls["ComapClient.idle"]
+    assert busy["loop"] >= BLOCKING_THRESHOLD
+    assert busy["longest"] >= BLOCKING_THRESHOLD
+    assert idle["total"] >= BLOCKING_THRESHOLD
+    assert idle["loop"] < BLOCKING_THRESHOLD / 2
+    assert list(client.stats.blocking) == ["ComapClient.busy"]
+
+
+async def test_sync_calls_on_the_loop(client) -> None:
+    """A slow sync call made on the loop thread is blocking."""
+    client.configure()
+
+    assert list(client.stats.blocking) == ["ComapClient.configure"]
+
+
+async def test_errors_and_cancellation_pass_through(client) -> None:
+    """Instrumented calls raise and cancel as the original ones."""
+    with pytest.raises(ValueError):
+        await client.failing()
+
+    task = asyncio.create_task(client.idle())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert client.stats.calls["ComapClient.failing"]["count"] == 1
+    assert client.stats.calls["ComapClient.idle"]["count"] == 1
+
+
+async def test_entry_debug_instrumentation(hass, mock_api, caplog) -> None:
+    """With debug logging, refreshes and client calls are timed on the loop."""
+    caplog.set_level(logging.DEBUG, logger="custom_components.comapsmarthome")
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_USERNAME: "user@example.com", CONF_PASSWORD: "secret"},
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    stats = hass.data[DOMAIN][entry.entry_id]["call_stats"]
+    assert stats.calls["ComapCoordinator.refresh"]["loop"] > 0
+    assert stats.calls["ComapClient.get_zones"]["count"] == 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
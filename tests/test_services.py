@@ -0,0 +1,42 @@
+"""Test the ComapSmartHome services."""
+from unittest.mock import patch
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from custom_components.comapsmarthome.const import ATTR_CYCLES, DOMAIN, SERVICE_PROFILE
+
+
+async def test_profile_leaves_statistics_and_heating_alone(
+    hass: HomeAssistant, mock_api
+) -> None:
+    """Profiling polls a detached coordinator and answers commands locally."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_USERNAME: "user@example.com", CONF_PASSWORD: "secret"},
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+    history = coordinator.temperature_history
+    cursor = history._cursor
+    zones = mock_api.count("/thermal-details")
+
+    with patch(
+        "custom_components.comapsmarthome.services._write_profile"
+    ) as write_profile:
+        await hass.services.async_call(
+            DOMAIN, SERVICE_PROFILE, {ATTR_CYCLES: 5}, blocking=True
+        )
+
+    write_profile.assert_called_once()
+    assert mock_api.count("/thermal-details") == zones + 5
+    assert mock_api.count("/heating-system-state") == 0
+    assert coordinator.temperature_history is history
+    assert history._cursor == cursor
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
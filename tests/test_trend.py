@@ -0,0 +1,42 @@
+"""Test the zone temperature history."""
+from custom_components.comapsmarthome.trend import ComapTemperatureHistory
+
+
+def _history(zone_ids, samples=6):
+    history = ComapTemperatureHistory(size=8)
+    for index in range(samples):
+        history.add(
+            index * 600,
+            {
+                zone_id: (18 + offset + index * 0.5, 21.0, True)
+                for offset, zone_id in enumerate(zone_ids)
+            },
+        )
+    return history
+
+
+def test_remove_compacts_rows() -> None:
+    """A removed zone frees its row, the others keep their samples."""
+    history = _history(["zone1", "zone2", "zone3"])
+    expected = history.estimate(3000)
+
+    history.remove("zone2")
+    history.remove("unknown")
+
+    assert history._times.shape == (2, 8)
+    assert history._rows == {"zone1": 0, "zone3": 1}
+    assert history.estimate(3000) == {
+        "zone1": expected["zone1"],
+        "zone3": expected["zone3"],
+    }
+
+
+def test_removed_zone_can_return() -> None:
+    """A zone added again starts with an empty history."""
+    history = _history(["zone1", "zone2"])
+    history.remove("zone1")
+    history.add(3600, {"zone1": (19.0, 21.0, True), "zone2": (22.0, 23.0, True)})
+
+    assert history._rows == {"zone2": 0, "zone1": 1}
+    assert history.estimate(3600)["zone1"]["temperature_trend"] is None
+    assert history.estimate(3600)["zone2"]["heating_rate"] == 3.0